@@ -16,14 +16,39 @@ Investigating it is useful for advanced players interested in getting data from
 The Navigation class in navigation.py contains functions related to path-finding, which are used by GameState in pathing related functions. 
 Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. \n 
 
-util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write().
+board_arrays.py describes the NumPy arrays returned by GameState.as_arrays(), which hold the board's structures and mobile unit counts. \n
+
+bitboard.py stores sets of map locations as single ints, with masks for the arena, its halves and edges. 
+Its flood_fill, pocket and can_reach_edge functions answer reachability questions in a few big-int operations. \n
+
+The IncrementalPathFinder class in pathing.py keeps per-edge distance fields alive between turns and repairs them as structures change. 
+AlgoCore creates one for you as self.path_finder, pass it to GameState to use it. \n
+
+The NumpyPathFinder class in numpy_navigation.py computes the same paths with NumPy wavefront expansion. 
+It needs numpy installed, select it with GameState(config, serialized_string, path_finder="numpy"). \n
+
+simulator.py contains simulate(), which plays out the coming action phase frame by frame in Python, 
+with the mobile units already on the map and any deploys you want to try, and reports the breaches and destroyed structures. 
+simulate_batch() runs many candidate attacks together as NumPy arrays and returns one row of results per attack. \n
+
+path_analysis.py contains path_sensitivity(), which finds the empty cells on your half that change enemy paths when blocked. \n
+
+targeting.py picks the targets of many attackers at once with NumPy, following the same rules as GameState.get_target. 
+Use it through GameState.get_targets(). \n
+
+The ThreatField class in threat.py holds the damage per frame enemy structures deal on every location. 
+Get one with GameState.threat_field() to score paths without calling get_attackers for every location. 
+The ShieldField class next to it, from GameState.shield_field(), holds the shield supports give on every location. \n
+
+util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write(), 
+and decode_json(), which parses engine messages with orjson when it is installed.
 """
 
 from .algocore import AlgoCore
-from .util import debug_write
+from .util import debug_write, decode_json
 from .game_state import GameState
 from .unit import GameUnit
 from .game_map import GameMap
 
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+__all__ = ["algocore", "bitboard", "board_arrays", "game_state", "game_map", "navigation", "numpy_navigation", "pathing", "path_analysis", "simulator", "targeting", "threat", "unit", "util"]
  
\ No newline at end of file
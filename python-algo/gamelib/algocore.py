@@ -1,7 +1,6 @@
-import json
-
 from .game_state import GameState
-from .util import get_command, debug_write, BANNER_TEXT, send_command
+from .pathing import IncrementalPathFinder
+from .util import get_command, debug_write, decode_json, BANNER_TEXT, send_command
 
 class AlgoCore(object):
     """
@@ -10,10 +9,30 @@ class AlgoCore(object):
 
     Attributes :
         * config (JSON): json object containing information about the game
+        * path_finder (:obj: IncrementalPathFinder): A path-finder that keeps its distance fields between turns. 
+          Pass it to GameState to make path queries cheaper after the first turn
+        * decoded_states (bool): If True, on_turn and on_action_frame are passed the decoded game state dict 
+          instead of the json string. GameState accepts either. False by default
 
     """
     def __init__(self):
         self.config = None
+        self.path_finder = IncrementalPathFinder()
+        self.decoded_states = False
+        self._message = None
+        self._state = None
+
+    def decode_state(self, message):
+        """
+        Returns the decoded dict of a game state message. \n
+        The message being handled was already decoded by start, so passing it here returns that dict 
+        instead of parsing it again. Other strings are decoded and dicts are returned as they are.
+        """
+        if isinstance(message, dict):
+            return message
+        if message is self._message:
+            return self._state
+        return decode_json(message)
 
     def on_game_start(self, config):
         """
@@ -27,6 +46,7 @@ class AlgoCore(object):
         """
         This step function is called at the start of each turn.
         It is passed the current game state, which can be used to initiate a new GameState object. 
+        The game state is a json string, or the decoded dict if decoded_states is True. 
         By default, it sends empty commands to the game engine. \n
         algo_strategy.py inherits from AlgoCore and overrides this on turn function. 
         Adjusting the on_turn function in algo_strategy is the main way to adjust your algo's logic. 
@@ -40,6 +60,8 @@ class AlgoCore(object):
         The action phase is made up of a sequence of distinct frames. 
         Each of these frames is sent to the algo in order. 
         They can be handled in this function. 
+        Each frame is a json string, or the decoded dict if decoded_states is True. 
+        decode_state turns the string into the dict start already decoded without parsing it again.
         """
         pass
 
@@ -61,22 +83,25 @@ class AlgoCore(object):
                 """
                 This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
                 """
-                parsed_config = json.loads(game_state_string)
+                parsed_config = decode_json(game_state_string)
                 self.on_game_start(parsed_config)
             elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
+                state = decode_json(game_state_string)
+                self._message = game_state_string
+                self._state = state
                 stateType = int(state.get("turnInfo")[0])
+                message = state if self.decoded_states else game_state_string
                 if stateType == 0:
                     """
                     This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
                     deploy phase. Printing is handled by the provided functions.
                     """
-                    self.on_turn(game_state_string)
+                    self.on_turn(message)
                 elif stateType == 1:
                     """
                     If stateType == 1, this game_state_string string represents a single frame of an action phase
                     """
-                    self.on_action_frame(game_state_string)
+                    self.on_action_frame(message)
                 elif stateType == 2:
                     """
                     This is the end game message. This means the game is over so break and finish the program.
@@ -0,0 +1,219 @@
+ARENA_SIZE = 28
+HALF_ARENA = 14
+
+"""
+A bitboard holds a set of map locations in a single Python int, with location [x, y] at bit
+y * ARENA_SIZE + x. Unions, intersections and whole-board neighbor steps are then a handful of
+big-int operations, which is much cheaper than visiting cells one at a time.
+
+Shifting a board by 1 moves every location one column, so the column masks below stop cells on
+the left and right borders from wrapping into the neighboring row.
+"""
+ROW_MASK = (1 << ARENA_SIZE) - 1
+LEFT_COLUMN = sum(1 << (y * ARENA_SIZE) for y in range(ARENA_SIZE))
+RIGHT_COLUMN = LEFT_COLUMN << (ARENA_SIZE - 1)
+NOT_LEFT_COLUMN = ((1 << (ARENA_SIZE * ARENA_SIZE)) - 1) & ~LEFT_COLUMN
+NOT_RIGHT_COLUMN = ((1 << (ARENA_SIZE * ARENA_SIZE)) - 1) & ~RIGHT_COLUMN
+
+# Cell ids number the arena row by row, bottom row first, like bits and like navigation.CELL_ID.
+# Each row's cells are then a contiguous slice of a cell indexed array.
+CELL_BITS = []
+BIT_CELLS = [-1] * (ARENA_SIZE * ARENA_SIZE)
+_ROW_SLICES = []
+for _y in range(ARENA_SIZE):
+    _row_size = _y + 1 if _y < HALF_ARENA else ARENA_SIZE - _y
+    _first = HALF_ARENA - _row_size
+    _ROW_SLICES.append((len(CELL_BITS), len(CELL_BITS) + 2 * _row_size, _y * ARENA_SIZE + _first))
+    for _x in range(_first, HALF_ARENA + _row_size):
+        BIT_CELLS[_y * ARENA_SIZE + _x] = len(CELL_BITS)
+        CELL_BITS.append(1 << (_y * ARENA_SIZE + _x))
+# The bit of every cell id, and the cell id of every bit (-1 outside the arena)
+CELL_BITS = tuple(CELL_BITS)
+BIT_CELLS = tuple(BIT_CELLS)
+NUM_CELLS = len(CELL_BITS)
+
+ARENA = sum(CELL_BITS)
+BOTTOM_HALF = ARENA & ((1 << (HALF_ARENA * ARENA_SIZE)) - 1)
+TOP_HALF = ARENA & ~BOTTOM_HALF
+_TO_BINARY_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+
+
+def location_bit(location):
+    """Gets the bit of a location
+
+    Args:
+        location: A map location
+
+    Returns:
+        An int with only the location's bit set, or 0 if the location is outside the arena
+
+    """
+    x = int(location[0])
+    y = int(location[1])
+    if x < 0 or y < 0 or x >= ARENA_SIZE or y >= ARENA_SIZE:
+        return 0
+    return (1 << (y * ARENA_SIZE + x)) & ARENA
+
+
+def from_locations(locations):
+    """Builds a bitboard holding the in-arena locations of a list of locations
+    """
+    board = 0
+    for location in locations or []:
+        board |= location_bit(location)
+    return board
+
+
+def to_locations(board):
+    """Gets the locations in a bitboard, bottom row first and left to right like GameMap iteration
+
+    Returns:
+        A list of [x, y] locations
+
+    """
+    locations = []
+    while board:
+        low = board & -board
+        bit = low.bit_length() - 1
+        locations.append([bit % ARENA_SIZE, bit // ARENA_SIZE])
+        board ^= low
+    return locations
+
+
+def from_cells(flags):
+    """Builds a bitboard from flags indexed by cell id, such as ShortestPathFinder.blocked
+
+    Args:
+        flags: A bytes-like object of NUM_CELLS zeros and ones
+
+    Returns:
+        A bitboard with the bits of the cells whose flag is 1
+
+    """
+    board = 0
+    for first, last, shift in _ROW_SLICES:
+        row = bytes(flags[first:last]).translate(_TO_BINARY_DIGITS)[::-1]
+        board |= int(row, 2) << shift
+    return board
+
+
+def blocked_board(game_map):
+    """Builds a bitboard of the locations holding a structure
+
+    Args:
+        game_map: A GameMap
+
+    Returns:
+        A bitboard of every location units cannot walk through
+
+    """
+    board = 0
+    for x, y in game_map.structure_locations():
+        board |= 1 << (y * ARENA_SIZE + x)
+    return board
+
+
+def _edge_board(edge):
+    if edge < 2:
+        rows = range(HALF_ARENA, ARENA_SIZE)
+    else:
+        rows = range(HALF_ARENA)
+    board = 0
+    for y in rows:
+        row_size = y + 1 if y < HALF_ARENA else ARENA_SIZE - y
+        x = HALF_ARENA - row_size if edge in (1, 2) else HALF_ARENA + row_size - 1
+        board |= 1 << (y * ARENA_SIZE + x)
+    return board
+
+# Indexed like GameMap.get_edges: [0] = top_right, [1] = top_left, [2] = bottom_left, [3] = bottom_right
+EDGES = tuple(_edge_board(edge) for edge in range(4))
+
+
+def neighbors(board):
+    """Gets every in-arena location one step up, down, left or right of a location in the board
+    """
+    return ((board << ARENA_SIZE) | (board >> ARENA_SIZE) | ((board & NOT_RIGHT_COLUMN) << 1) | ((board & NOT_LEFT_COLUMN) >> 1)) & ARENA
+
+
+# The neighbors of each cell, indexed by cell id
+NEIGHBOR_BITS = tuple(neighbors(bit) for bit in CELL_BITS)
+
+
+def flood_fill(seeds, open_cells):
+    """Gets every location reachable from the seeds by stepping through open locations
+
+    Args:
+        seeds: A bitboard of starting locations. Seeds that are not open are ignored
+        open_cells: A bitboard of the locations units can walk on
+
+    Returns:
+        A bitboard of the reachable locations, including the open seeds
+
+    """
+    reached = seeds & open_cells
+    frontier = reached
+    while frontier:
+        frontier = neighbors(frontier) & open_cells & ~reached
+        reached |= frontier
+    return reached
+
+
+def pocket(location, blocked):
+    """Gets the pocket of pathable space a location is in
+
+    Args:
+        location: A map location
+        blocked: A bitboard of the locations holding structures, see blocked_board
+
+    Returns:
+        A bitboard of every location a unit at location could walk to, 0 if the location is blocked
+
+    """
+    return flood_fill(location_bit(location), ARENA & ~blocked)
+
+
+def can_reach_edge(location, edge, blocked):
+    """Checks if a unit at a location can reach any location of an edge
+
+    Args:
+        location: A map location
+        edge: The edge to reach, for example game_map.TOP_RIGHT
+        blocked: A bitboard of the locations holding structures, see blocked_board
+
+    Returns:
+        True if the edge can be reached, False if the unit would have to self destruct
+
+    """
+    return pocket(location, blocked) & EDGES[edge] != 0
+
+
+def lowest_cell(board):
+    """Gets the cell id of the lowest bit of a non empty bitboard
+    """
+    return BIT_CELLS[(board & -board).bit_length() - 1]
+
+
+def most_ideal(board, direction):
+    """Gets the cell of a non empty bitboard a unit heading in direction would self destruct on
+
+    Idealness prefers the row furthest in the y direction first, then the column furthest
+    in the x direction, so the answer is found from the extreme row of the board.
+
+    Args:
+        board: A non empty bitboard, usually a pocket
+        direction: The (x, y) direction of the unit's target edge
+
+    Returns:
+        The cell id with the highest idealness in the board
+
+    """
+    if direction[1] == 1:
+        row = (board.bit_length() - 1) // ARENA_SIZE
+    else:
+        row = ((board & -board).bit_length() - 1) // ARENA_SIZE
+    row_bits = (board >> (row * ARENA_SIZE)) & ROW_MASK
+    if direction[0] == 1:
+        x = row_bits.bit_length() - 1
+    else:
+        x = (row_bits & -row_bits).bit_length() - 1
+    return BIT_CELLS[row * ARENA_SIZE + x]
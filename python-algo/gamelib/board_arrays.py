@@ -0,0 +1,81 @@
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+The board as NumPy arrays, see GameState.as_arrays. Every array is indexed [x, y] like game_map[x, y].
+
+    * structure_type (int8): The structure's index in config["unitInformation"] (0 for WALL, 1 for SUPPORT, 2 for TURRET), -1 if empty
+    * owner (int8): The structure's player index, -1 if empty
+    * health (float32): The structure's current health, 0 if empty
+    * max_health (float32): The structure's starting health, 0 if empty
+    * upgraded (bool): True where the structure is upgraded
+    * pending_removal (bool): True where the structure is marked for removal by its owner
+    * mobile_counts (int16): Number of mobile units, indexed [player_index, mobile type, x, y]. Mobile types are numbered
+      in config order, so with the default config 0 is SCOUT, 1 is DEMOLISHER and 2 is INTERCEPTOR
+"""
+BoardArrays = namedtuple("BoardArrays", ["structure_type", "owner", "health", "max_health", "upgraded", "pending_removal", "mobile_counts"])
+
+
+def unit_type_indices(config):
+    """Gets the structure and mobile type numbering used by BoardArrays
+
+    Returns:
+        A tuple (structure_index, mobile_index) of dicts mapping each unit type's shorthand to its number
+
+    """
+    structure_index = {}
+    mobile_index = {}
+    for index, unit_information in enumerate(config["unitInformation"]):
+        category = unit_information.get("unitCategory")
+        if category == 0:
+            structure_index[unit_information["shorthand"]] = index
+        elif category == 1:
+            mobile_index[unit_information["shorthand"]] = len(mobile_index)
+    return structure_index, mobile_index
+
+
+def empty_board_arrays(arena_size, mobile_types):
+    if np is None:
+        raise ImportError("Board arrays require numpy")
+    shape = (arena_size, arena_size)
+    return BoardArrays(
+        np.full(shape, -1, dtype=np.int8),
+        np.full(shape, -1, dtype=np.int8),
+        np.zeros(shape, dtype=np.float32),
+        np.zeros(shape, dtype=np.float32),
+        np.zeros(shape, dtype=bool),
+        np.zeros(shape, dtype=bool),
+        np.zeros((2, mobile_types) + shape, dtype=np.int16))
+
+
+def write_location(arrays, units, x, y, structure_index, mobile_index):
+    """Overwrites the arrays at [x, y] with the given units
+
+    Args:
+        arrays: The BoardArrays to update
+        units: The list of GameUnits at the location
+        x, y: The location
+        structure_index, mobile_index: The numbering from unit_type_indices
+
+    """
+    arrays.structure_type[x, y] = -1
+    arrays.owner[x, y] = -1
+    arrays.health[x, y] = 0
+    arrays.max_health[x, y] = 0
+    arrays.upgraded[x, y] = False
+    arrays.pending_removal[x, y] = False
+    arrays.mobile_counts[:, :, x, y] = 0
+    for unit in units:
+        if unit.stationary:
+            arrays.structure_type[x, y] = structure_index[unit.unit_type]
+            arrays.owner[x, y] = unit.player_index
+            arrays.health[x, y] = unit.health
+            arrays.max_health[x, y] = unit.max_health
+            arrays.upgraded[x, y] = unit.upgraded
+            arrays.pending_removal[x, y] = unit.pending_removal
+        elif unit.player_index in (0, 1):
+            arrays.mobile_counts[unit.player_index, mobile_index[unit.unit_type], x, y] += 1
@@ -1,6 +1,60 @@
 import math
-from .unit import GameUnit
+import itertools
+from .unit import GameUnit, unit_specs
 from .util import debug_write
+from .board_arrays import unit_type_indices, empty_board_arrays, write_location
+
+"""
+The board never changes shape, so the diamond is worked out once here instead of on every call.
+
+    * IN_BOUNDS (tuple): 28x28 bitmap indexed IN_BOUNDS[x][y], True for locations on the board
+    * ARENA_CELLS (tuple): Every (x, y) on the board, bottom row first and left to right, the order GameMap iterates in
+    * CELLS_BY_HALF (tuple): The cells of the bottom half (player 0) and of the top half (player 1), same order
+    * CELLS_BY_ROW (tuple): The cells of each row, indexed by y
+"""
+_ARENA_SIZE = 28
+_HALF_ARENA = 14
+
+
+def _row_cells(y):
+    row_size = y + 1 if y < _HALF_ARENA else _ARENA_SIZE - y
+    return tuple((x, y) for x in range(_HALF_ARENA - row_size, _HALF_ARENA + row_size))
+
+CELLS_BY_ROW = tuple(_row_cells(y) for y in range(_ARENA_SIZE))
+ARENA_CELLS = tuple(cell for row in CELLS_BY_ROW for cell in row)
+CELLS_BY_HALF = (tuple(cell for cell in ARENA_CELLS if cell[1] < _HALF_ARENA), tuple(cell for cell in ARENA_CELLS if cell[1] >= _HALF_ARENA))
+IN_BOUNDS = tuple(tuple((x, y) in set(CELLS_BY_ROW[y]) for y in range(_ARENA_SIZE)) for x in range(_ARENA_SIZE))
+_ARENA_CELL_SET = frozenset(ARENA_CELLS)
+
+# Board versions come from one counter shared by every GameMap, so a version is never given to two different boards,
+# even when one map is a fork of another or a transaction is rolled back
+_board_versions = itertools.count(1)
+
+
+def next_board_version():
+    """Gets a board version that has never been used before
+    """
+    return next(_board_versions)
+
+# Range queries only depend on the radius and the config's getHitRadius, so their results are
+# shared by every GameMap. Offsets are keyed by (radius, getHitRadius), clipped cells by (x, y, radius, getHitRadius).
+_RANGE_OFFSETS = {}
+_RANGE_CELLS = {}
+_RANGE_KEYS = ("attackRange", "shieldRange", "selfDestructRange")
+
+
+def _range_offsets(radius, get_hit_radius):
+    """The (dx, dy) offsets whose centers are within radius + get_hit_radius, x major like the original square scan
+    """
+    key = (radius, get_hit_radius)
+    offsets = _RANGE_OFFSETS.get(key)
+    if offsets is None:
+        search_radius = math.ceil(radius)
+        limit = (radius + get_hit_radius) ** 2
+        span = range(-search_radius, search_radius + 1)
+        offsets = tuple((dx, dy) for dx in span for dy in span if dx * dx + dy * dy < limit)
+        _RANGE_OFFSETS[key] = offsets
+    return offsets
 
 class GameMap:
     """Holds data about the current game map and provides functions
@@ -18,6 +72,15 @@ class GameMap:
         * TOP_LEFT (int): A constant that represents the top left edge
         * BOTTOM_LEFT (int): Hidden challenge! Can you guess what this constant represents???
         * BOTTOM_RIGHT (int): A constant that represents the bottom right edge
+        * board_version (int): Changed to a new, never used value every time structures are added to or removed from the map, 
+          or upgraded by GameState.attempt_upgrade
+
+    Mobile units added in bulk with add_units are stored as stacks, one count and health pool per type, player
+    and location. A stack is turned into individual GameUnits the first time its location is read with game_map[x, y].
+
+    Structures are also kept in an occupancy index, see structure_at and structure_locations. It is updated by
+    game_map[x, y] = units, add_unit, remove_unit and place_unit, so edit the map through those rather than by
+    changing the list game_map[x, y] returns.
 
     """
     def __init__(self, config):
@@ -36,36 +99,75 @@ class GameMap:
         self.BOTTOM_LEFT = 2
         self.BOTTOM_RIGHT = 3
         self.__map = self.__empty_grid()
-        self.__start = [13,0]
+        self.board_version = 0
+        self.__structures = {}
+        self.__structure_sets = {}
+        self.__arrays = None
+        self.__stacks = {}
+        # Set by fork, the cells this map has its own copy of. Every other cell is shared with another map
+        self.__owned = None
+        # While a transaction is open, the state of each location before every change, see _undo_mark
+        self.__undo_log = None
+        self.__undo_depth = 0
+        self.__get_hit_radius = config["unitInformation"][0]['getHitRadius']
+        for unit_information in config["unitInformation"]:
+            for information in [unit_information, unit_information.get("upgrade", {})]:
+                for key in _RANGE_KEYS:
+                    if key in information:
+                        _range_offsets(information[key], self.__get_hit_radius)
     
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
             x,y = location
+            if self.__owned is not None:
+                self.__own(x, y)
+            if self.__stacks and (x, y) in self.__stacks:
+                self.__materialize(x, y)
             return self.__map[x][y]
         self._invalid_coordinates(location)
 
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
-            self.__map[location[0]][location[1]] = val
+            x, y = location
+            self.__save(x, y)
+            self.__map[x][y] = val
+            self.__mark_owned(x, y)
+            self.__stacks.pop((x, y), None)
+            self.__unindex(x, y)
+            for unit in val:
+                if unit.stationary:
+                    self.__index(unit, x, y)
+            self.board_version = next_board_version()
+            self.__write_arrays(x, y)
             return
         self._invalid_coordinates(location)
 
     def __iter__(self):
-        self.__start = [13,0]
-        return self
-    
-    def __next__(self):
-        location = self.__start
-        if location == [15,27]:
-            raise StopIteration
-        new_location = [location[0]+1, location[1]]
-        while not self.in_arena_bounds(new_location) and not location == [14,27]:
-            if new_location[0] == self.ARENA_SIZE:
-                new_location = [0, new_location[1]+1]
-            else:
-                new_location = [new_location[0]+1, new_location[1]]
-        self.__start = new_location
-        return location 
+        # A fresh iterator every time, so loops over the map can be nested
+        return (list(location) for location in ARENA_CELLS)
+
+    def iter_cells(self, half=None, row=None):
+        """Iterates over board locations without allocating anything. Locations are (x, y) tuples
+        from precomputed tables, bottom row first and left to right.
+
+        Args:
+            half: 0 for the bottom half (player 0's side), 1 for the top half (player 1's side). The whole board if None
+            row: Only yield the locations with this y. Every row if None
+
+        Returns:
+            An iterator of (x, y) tuples
+
+        """
+        if row is not None:
+            if not 0 <= row < self.ARENA_SIZE:
+                return iter(())
+            cells = CELLS_BY_ROW[row]
+            if half is not None and (row >= self.HALF_ARENA) != (half == 1):
+                return iter(())
+            return iter(cells)
+        if half is not None:
+            return iter(CELLS_BY_HALF[half])
+        return iter(ARENA_CELLS)
 
     def __empty_grid(self):
         grid = []
@@ -89,19 +191,7 @@ class GameMap:
         
         """
         x, y = location
-        half_board = self.HALF_ARENA
-
-        row_size = y + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        top_half_check = (y < self.HALF_ARENA and x >= startx and x <= endx)
-
-        row_size = (self.ARENA_SIZE - 1 - y) + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        bottom_half_check = (y >= self.HALF_ARENA and x >= startx and x <= endx)
-
-        return bottom_half_check or top_half_check
+        return (x, y) in _ARENA_CELL_SET
 
     def get_edge_locations(self, quadrant_description):
         """Takes in an edge description and returns a list of locations.
@@ -168,10 +258,102 @@ class GameMap:
 
         x, y = location
         new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
+        self.__save(x, y)
         if not new_unit.stationary:
+            self.__own(x, y)
             self.__map[x][y].append(new_unit)
         else:
             self.__map[x][y] = [new_unit]
+            self.__mark_owned(x, y)
+            self.__stacks.pop((x, y), None)
+            self.__unindex(x, y)
+            self.__index(new_unit, x, y)
+            self.board_version = next_board_version()
+        self.__write_arrays(x, y)
+
+    def add_units(self, unit_type, location, player_index=0, count=1):
+        """Adds many mobile units of one type to the map at once, as a single stack
+
+        Args:
+            unit_type: The type of the new units, a mobile unit type
+            location: The [x, y] location of the new units
+            player_index: The index corresponding to the player controlling the new units, 0 for you 1 for the enemy
+            count: The number of units to add
+
+        Like add_unit, this only changes the data stored in GameMap.
+        """
+        if not self.in_arena_bounds(location):
+            self._invalid_coordinates(location)
+            return
+        if player_index < 0 or player_index > 1:
+            self.warn("Player index {} is invalid. Player index should be 0 or 1.".format(player_index))
+            return
+        if count <= 0:
+            return
+        x, y = map(int, location)
+        spec = unit_specs(self.config)[unit_type][0]
+        if spec.stationary:
+            self.warn("Structures can not be stacked, use add_unit to add a {}".format(unit_type))
+            return
+        self.__save(x, y)
+        stacks = self.__stacks.setdefault((x, y), {})
+        stack = stacks.setdefault((unit_type, player_index), [0, 0])
+        stack[0] += count
+        stack[1] += count * spec.max_health
+        self.__write_arrays(x, y)
+
+    def mobile_unit_count(self, location, unit_type=None, player_index=None):
+        """Counts the mobile units at a location, including stacked ones, without creating their GameUnits
+
+        Args:
+            location: A map location
+            unit_type: Only count units of this type. Every type if None
+            player_index: Only count units of this player. Both players if None
+
+        Returns:
+            The number of matching mobile units
+
+        """
+        x, y = location
+        if not self.in_arena_bounds(location):
+            return 0
+        count = 0
+        for unit in self.__map[x][y]:
+            if not unit.stationary and unit_type in (None, unit.unit_type) and player_index in (None, unit.player_index):
+                count += 1
+        for (stack_type, stack_player), (stack_count, _) in self.__stacks.get((x, y), {}).items():
+            if unit_type in (None, stack_type) and player_index in (None, stack_player):
+                count += stack_count
+        return count
+
+    def __materialize(self, x, y):
+        self.__save(x, y)
+        self.__own(x, y)
+        cell = self.__map[x][y]
+        for (unit_type, player_index), (count, health) in self.__stacks.pop((x, y)).items():
+            unit_health = health / count
+            cell.extend(GameUnit(unit_type, self.config, player_index, unit_health, x, y) for _ in range(count))
+
+    def place_unit(self, unit):
+        """Adds an existing GameUnit to the map at its own location, keeping any units already there.
+        Used when parsing the game state, where units arrive with their health and other details filled in.
+
+        Args:
+            unit: The GameUnit to add. A structure replaces any structure already at its location in the occupancy index
+
+        """
+        x, y = unit.x, unit.y
+        if not self.in_arena_bounds([x, y]):
+            self._invalid_coordinates([x, y])
+            return
+        self.__save(x, y)
+        self.__own(x, y)
+        self.__map[x][y].append(unit)
+        if unit.stationary:
+            self.__unindex(x, y)
+            self.__index(unit, x, y)
+            self.board_version = next_board_version()
+        self.__write_arrays(x, y)
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -186,7 +368,206 @@ class GameMap:
             self._invalid_coordinates(location)
         
         x, y = location
+        self.__save(x, y)
+        if any(unit.stationary for unit in self.__map[x][y]):
+            self.board_version = next_board_version()
         self.__map[x][y] = []
+        self.__mark_owned(x, y)
+        self.__stacks.pop((x, y), None)
+        self.__unindex(x, y)
+        self.__write_arrays(x, y)
+
+    def refresh_location(self, location):
+        """Brings the board arrays up to date after a unit at a location was changed in place,
+        for example upgraded or damaged. Adding and removing units through GameMap does this automatically.
+
+        Args:
+            location: The location of the changed unit
+
+        """
+        x, y = location
+        self.__write_arrays(int(x), int(y))
+
+    def as_arrays(self):
+        """Gets the board as NumPy arrays, see board_arrays.BoardArrays. Needs numpy.
+
+        The arrays are built on the first call and then updated in place whenever the map changes,
+        so later calls return the same, current arrays. Treat them as read only.
+
+        Returns:
+            A BoardArrays of 28x28 arrays indexed [x, y]
+
+        """
+        if self.__arrays is None:
+            self.__type_indices = unit_type_indices(self.config)
+            self.__arrays = empty_board_arrays(self.ARENA_SIZE, len(self.__type_indices[1]))
+            for x, y in ARENA_CELLS:
+                if self.__map[x][y] or (x, y) in self.__stacks:
+                    self.__write_arrays(x, y)
+        return self.__arrays
+
+    def __write_arrays(self, x, y):
+        if self.__arrays is not None:
+            write_location(self.__arrays, self.__map[x][y], x, y, *self.__type_indices)
+            mobile_index = self.__type_indices[1]
+            for (unit_type, player_index), (count, _) in self.__stacks.get((x, y), {}).items():
+                self.__arrays.mobile_counts[player_index, mobile_index[unit_type], x, y] += count
+
+    def structure_at(self, location):
+        """Gets the structure at a location from the occupancy index, without scanning the location's units
+
+        Args:
+            location: A map location
+
+        Returns:
+            The structure's GameUnit, or None if there is no structure there or the location is outside the arena
+
+        """
+        x, y = location
+        unit = self.__structures.get((x, y))
+        if unit is not None and self.__owned is not None and (x, y) not in self.__owned:
+            # The unit is shared with another map, take this map's own copy before handing it out
+            self.__own(x, y)
+            unit = self.__structures[(x, y)]
+        return unit
+
+    def structure_locations(self, player_index=None, unit_type=None):
+        """Gets the locations of structures from the occupancy index, in time proportional to the number found
+
+        Args:
+            player_index: Only get structures of this player, 0 for you 1 for the enemy. Both players if None
+            unit_type: Only get structures of this type, for example TURRET. Every type if None
+
+        Returns:
+            A list of (x, y) tuples, in no particular order
+
+        """
+        if player_index is None and unit_type is None:
+            return list(self.__structures)
+        players = self.__structure_sets.values() if player_index is None else [self.__structure_sets.get(player_index, {})]
+        locations = []
+        for sets in players:
+            if unit_type is None:
+                for cells in sets.values():
+                    locations.extend(cells)
+            else:
+                locations.extend(sets.get(unit_type, ()))
+        return locations
+
+    def fork(self):
+        """Gets an independent copy of the map that shares its unit lists with this one until either map changes them
+
+        Only the grid of cell references and the occupancy index are copied up front. The first time a location is
+        read with game_map[x, y] or structure_at, or changed, on either map, that map copies the location's units for itself.
+
+        Returns:
+            A new GameMap with the same units, stacks, board arrays and board_version
+
+        """
+        other = GameMap.__new__(GameMap)
+        other.__dict__.update(self.__dict__)
+        other.__map = [column[:] for column in self.__map]
+        other.__structures = dict(self.__structures)
+        other.__structure_sets = {player: {unit_type: set(cells) for unit_type, cells in sets.items()} for player, sets in self.__structure_sets.items()}
+        other.__stacks = {location: {key: list(stack) for key, stack in stacks.items()} for location, stacks in self.__stacks.items()}
+        if self.__arrays is not None:
+            other.__arrays = type(self.__arrays)(*(array.copy() for array in self.__arrays))
+        other.__owned = set()
+        other.__undo_log = None
+        other.__undo_depth = 0
+        self.__owned = set()
+        return other
+
+    def _undo_mark(self):
+        """Starts recording changes so they can be undone, see GameState.transaction
+
+        Returns:
+            A mark to pass to _undo_to or _undo_release
+
+        """
+        if self.__undo_log is None:
+            self.__undo_log = []
+        self.__undo_depth += 1
+        return len(self.__undo_log), self.board_version
+
+    def _undo_to(self, mark):
+        """Undoes every change recorded since mark was made, newest first
+        """
+        length, board_version = mark
+        log = self.__undo_log
+        while len(log) > length:
+            entry = log.pop()
+            if entry[0] is None:
+                _, unit, spec, upgraded = entry
+                unit._spec = spec
+                unit.upgraded = upgraded
+                self.__write_arrays(unit.x, unit.y)
+                continue
+            x, y, units, owned, stacks = entry
+            # A fresh list, since a fork made during the transaction may share the logged one
+            cell = self.__map[x][y] = list(units)
+            if self.__owned is not None and not owned:
+                self.__owned.discard((x, y))
+            if stacks is None:
+                self.__stacks.pop((x, y), None)
+            else:
+                self.__stacks[(x, y)] = stacks
+            self.__unindex(x, y)
+            for unit in cell:
+                if unit.stationary:
+                    self.__index(unit, x, y)
+            self.__write_arrays(x, y)
+        self.board_version = board_version
+
+    def _undo_release(self, mark):
+        """Keeps the changes recorded since mark was made. Recording stops once the outermost transaction is over
+        """
+        self.__undo_depth -= 1
+        if self.__undo_depth == 0:
+            self.__undo_log = None
+
+    def _undo_unit(self, unit):
+        """Records a unit's upgrade state before it is changed in place
+        """
+        if self.__undo_log is not None:
+            self.__undo_log.append((None, unit, unit._spec, unit.upgraded))
+
+    def __save(self, x, y):
+        """Records a location's contents before it is changed
+        """
+        if self.__undo_log is not None:
+            cell = self.__map[x][y]
+            stacks = self.__stacks.get((x, y))
+            if stacks is not None:
+                stacks = {key: list(stack) for key, stack in stacks.items()}
+            owned = self.__owned is not None and (x, y) in self.__owned
+            self.__undo_log.append((x, y, list(cell), owned, stacks))
+
+    def __own(self, x, y):
+        """Gives this map its own copy of a location's units, if it still shares them
+        """
+        owned = self.__owned
+        if owned is None or (x, y) in owned:
+            return
+        owned.add((x, y))
+        cell = [unit.copy() for unit in self.__map[x][y]]
+        self.__map[x][y] = cell
+        for unit in cell:
+            if unit.stationary:
+                self.__structures[(x, y)] = unit
+
+    def __mark_owned(self, x, y):
+        if self.__owned is not None:
+            self.__owned.add((x, y))
+
+    def __index(self, unit, x, y):
+        self.__structures[(x, y)] = unit
+        self.__structure_sets.setdefault(unit.player_index, {}).setdefault(unit.unit_type, set()).add((x, y))
+
+    def __unindex(self, x, y):
+        unit = self.__structures.pop((x, y), None)
+        if unit is not None:
+            self.__structure_sets[unit.player_index][unit.unit_type].discard((x, y))
 
     def get_locations_in_range(self, location, radius):
         """Gets locations in a circular area around a location
@@ -204,17 +585,31 @@ class GameMap:
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
 
+        return [list(cell) for cell in self.locations_in_range(location, radius)]
+
+    def locations_in_range(self, location, radius):
+        """Gets locations in a circular area around a location, from a cache shared by every turn.
+        Same as get_locations_in_range, but returns an immutable tuple of (x, y) tuples, which is much faster.
+
+        Args:
+            location: The center of our search area
+            radius: The radius of our search area
+
+        Returns:
+            A tuple of the (x, y) locations that are within our search area
+
+        """
         x, y = location
-        locations = []
-        search_radius = math.ceil(radius)
-        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
-        for i in range(int(x - search_radius), int(x + search_radius + 1)):
-            for j in range(int(y - search_radius), int(y + search_radius + 1)):
-                new_location = [i, j]
-                # A unit with a given range affects all locations whose centers are within that range + get hit radius
-                if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + getHitRadius:
-                    locations.append(new_location)
-        return locations
+        x = int(x)
+        y = int(y)
+        key = (x, y, radius, self.__get_hit_radius)
+        cells = _RANGE_CELLS.get(key)
+        if cells is None:
+            # A unit with a given range affects all locations whose centers are within that range + get hit radius
+            cells = tuple((x + dx, y + dy) for dx, dy in _range_offsets(radius, self.__get_hit_radius) if (x + dx, y + dy) in _ARENA_CELL_SET)
+            if (x, y) in _ARENA_CELL_SET:
+                _RANGE_CELLS[key] = cells
+        return cells
 
     def distance_between_locations(self, location_1, location_2):
         """Euclidean distance
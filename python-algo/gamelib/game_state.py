@@ -2,10 +2,19 @@ import math
 import json
 import sys
 
-from .navigation import ShortestPathFinder
-from .util import send_command, debug_write
+from .navigation import ShortestPathFinder, timed_path
+from .numpy_navigation import NumpyPathFinder
+from .util import send_command, debug_write, decode_json
 from .unit import GameUnit
-from .game_map import GameMap
+from .game_map import GameMap, next_board_version
+from .threat import ThreatField, ShieldField
+from .targeting import select_targets, candidate_arrays
+
+"""
+Path-finder backends that can be selected by name when creating a GameState.
+The numpy backend raises ImportError when numpy is not installed.
+"""
+PATH_FINDERS = {"python": ShortestPathFinder, "numpy": NumpyPathFinder}
 
 def is_stationary(unit_type):
     """
@@ -44,15 +53,25 @@ class GameState:
         * my_time (int): The time you took to submit your previous turn
         * enemy_health (int): Your opponents current remaining health
         * enemy_time (int): Your opponents current remaining time
+        * path_cache_hits (int): The number of find_path_to_edge calls answered from the path cache
+        * path_cache_misses (int): The number of find_path_to_edge calls that had to run the path-finder
 
     """
 
-    def __init__(self, config, serialized_string):
+    def __init__(self, config, serialized_string, path_finder=None, lazy=False):
         """ Setup a turns variables using arguments passed
 
         Args:
             * config (JSON): A json object containing information about the game
-            * serialized_string (string): A string containing information about the game state at the start of this turn
+            * serialized_string (string): A string containing information about the game state at the start of this turn. 
+              The already decoded dict is also accepted, see AlgoCore.decoded_states
+            * path_finder (:obj: ShortestPathFinder): The path-finder to use for pathing functions. 
+              Pass a long lived IncrementalPathFinder (see AlgoCore.path_finder) to reuse its work between turns. 
+              A new ShortestPathFinder is used if None. The name of a backend in PATH_FINDERS, such as "numpy", 
+              creates a new path-finder of that kind.
+            * lazy (bool): If True, only resources, health and turn info are parsed now. The units are added to game_map 
+              the first time it is used, directly or through functions like contains_stationary_unit and find_path_to_edge, 
+              so turns that never look at the board skip building them.
 
         """
         self.serialized_string = serialized_string
@@ -89,21 +108,94 @@ class GameState:
         MP = self.MP
         SP = self.SP
 
-        self.game_map = GameMap(self.config)
-        self._shortest_path_finder = ShortestPathFinder()
+        self._game_map = GameMap(self.config)
+        self._pending_units = None
+        if path_finder is None:
+            path_finder = ShortestPathFinder()
+        elif isinstance(path_finder, str):
+            if path_finder not in PATH_FINDERS:
+                raise ValueError("Unknown path-finder backend {}, expected one of {}".format(path_finder, sorted(PATH_FINDERS)))
+            path_finder = PATH_FINDERS[path_finder]()
+        self._shortest_path_finder = path_finder
+        self._path_cache = {}
+        self._path_cache_version = 0
+        self._structure_fields = {}
+        self.path_cache_hits = 0
+        self.path_cache_misses = 0
         self._build_stack = []
         self._deploy_stack = []
         self._player_resources = [
                 {'SP': 0, 'MP': 0},  # player 0, which is you
                 {'SP': 0, 'MP': 0}]  # player 1, which is the opponent
-        self.__parse_state(serialized_string)
+        self.__parse_state(serialized_string, lazy)
+
+    def fork(self):
+        """Gets an independent copy of this game state to try out moves on, much faster than copy.deepcopy
+
+        The board is copied on write (see GameMap.fork), the resources and build and deploy queues are copied, 
+        and the config, unit specs and path-finder are shared. Spawning, removing or upgrading on the fork 
+        does not change this game state, or the other way around.
+
+        Returns:
+            A new GameState
+
+        """
+        other = GameState.__new__(GameState)
+        other.__dict__.update(self.__dict__)
+        other.game_map = self.game_map.fork()
+        other._player_resources = [dict(resources) for resources in self._player_resources]
+        other._build_stack = list(self._build_stack)
+        other._deploy_stack = list(self._deploy_stack)
+        other._path_cache = dict(self._path_cache)
+        other._structure_fields = {key: field.copy() for key, field in self._structure_fields.items()}
+        return other
+
+    def transaction(self):
+        """Starts recording changes so speculative spawns, removals and upgrades can be undone
+
+        Use it as a context manager. Changes are kept when the block ends, unless it raises, 
+        and tx.rollback() undoes everything done since the block started::
+
+            with game_state.transaction() as tx:
+                game_state.attempt_spawn(TURRET, locations)
+                if not good_enough(game_state):
+                    tx.rollback()
+
+        Rolling back restores the board, resources, build and deploy queues and board_version in time 
+        proportional to the number of changes made, instead of copying the whole state. Transactions can be nested.
 
-    def __parse_state(self, state_line):
+        Returns:
+            A Transaction
+
+        """
+        return Transaction(self)
+
+    @property
+    def game_map(self):
+        """The current GameMap. When the GameState is lazy, the turn's units are added to it the first time it is used
+        """
+        if self._pending_units is not None:
+            p1units, p2units = self._pending_units
+            self._pending_units = None
+            self.__create_parsed_units(p1units, 0)
+            self.__create_parsed_units(p2units, 1)
+        return self._game_map
+
+    @game_map.setter
+    def game_map(self, game_map):
+        self._pending_units = None
+        self._game_map = game_map
+
+    def __parse_state(self, state_line, lazy=False):
         """
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
-        state_line is the game state as a json string.
+        state_line is the game state as a json string, or the dict it decodes to.
+        If lazy, the unit lists are kept as they are until game_map is first used.
         """
-        state = json.loads(state_line)
+        if isinstance(state_line, dict):
+            state = state_line
+        else:
+            state = decode_json(state_line)
 
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
@@ -123,6 +215,9 @@ class GameState:
         p1units = state["p1Units"]
         p2units = state["p2Units"]
 
+        if lazy:
+            self._pending_units = (p1units, p2units)
+            return
         self.__create_parsed_units(p1units, 0)
         self.__create_parsed_units(p2units, 1)
 
@@ -147,7 +242,7 @@ class GameState:
                         self.game_map[x,y][0].upgrade()
                 else:
                     unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
-                    self.game_map[x,y].append(unit)
+                    self.game_map.place_unit(unit)
 
     def __resource_required(self, unit_type):
         return self.SP if is_stationary(unit_type) else self.MP
@@ -373,6 +468,8 @@ class GameState:
       
         if type(locations[0]) == int:
             locations = [locations]
+        if not is_stationary(unit_type):
+            return self.__spawn_mobile_stacks(unit_type, locations, num)
         spawned_units = 0
         for location in locations:
             for i in range(num):
@@ -391,6 +488,29 @@ class GameState:
                     break
         return spawned_units
 
+    def __spawn_mobile_stacks(self, unit_type, locations, num):
+        """
+        attempt_spawn for mobile units. Instead of checking and spawning one unit at a time, the number of 
+        affordable units is worked out once per location and they are added to the map as a single stack. 
+        The deploy stack and warnings are the same as spawning them one by one.
+        """
+        costs = self.type_cost(unit_type)
+        spawned_units = 0
+        for location in locations:
+            if num <= 0 or not self.can_spawn(unit_type, location, 1):
+                continue
+            count = min(num, self.number_affordable(unit_type))
+            x, y = map(int, location)
+            self.__set_resource(SP, 0 - costs[SP] * count)
+            self.__set_resource(MP, 0 - costs[MP] * count)
+            self.game_map.add_units(unit_type, [x, y], 0, count)
+            self._deploy_stack.extend([(unit_type, x, y)] * count)
+            spawned_units += count
+            if count < num:
+                # Spawning one at a time stops with a failed check, which warns about the missing resources
+                self.can_spawn(unit_type, location, 1)
+        return spawned_units
+
     def attempt_remove(self, locations):
         """Attempts to remove existing friendly structures in the given locations.
 
@@ -408,6 +528,7 @@ class GameState:
             if location[1] < self.HALF_ARENA and self.contains_stationary_unit(location):
                 x, y = map(int, location)
                 self._build_stack.append((REMOVE, x, y))
+                self.game_map.board_version = next_board_version()
                 removed_units += 1
             else:
                 self.warn("Could not remove a unit from {}. Location has no structures or is enemy territory.".format(location))
@@ -445,7 +566,10 @@ class GameState:
                     if resources[SP] >= costs[SP] and resources[MP] >= costs[MP]:
                         self.__set_resource(SP, 0 - costs[SP])
                         self.__set_resource(MP, 0 - costs[MP])
+                        self.game_map._undo_unit(existing_unit)
                         existing_unit.upgrade()
+                        self.game_map.refresh_location([x, y])
+                        self.game_map.board_version = next_board_version()
                         self._build_stack.append((UPGRADE, x, y))
                         spawned_units += 1
             else:
@@ -475,19 +599,24 @@ class GameState:
         elif right and top:
             return self.game_map.BOTTOM_LEFT
 
-    def find_path_to_edge(self, start_location, target_edge=None):
+    def find_path_to_edge(self, start_location, target_edge=None, extra_blocked=None, extra_open=None):
         """Gets the path a unit at a given location would take. 
         If final point is not on an edge, it is a self destruct path
 
         Args:
             start_location: The location of a hypothetical unit
             target_edge: The edge the unit wants to reach. game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc. Induced from start_location if None.
+            extra_blocked: A list of locations to treat as holding structures, to test hypothetical walls without changing the game map
+            extra_open: A list of locations to treat as empty, to test removing structures without changing the game map
 
         Returns:
             A list of locations corresponding to the path the unit would take 
             to get from it's starting location to the best available end location
 
         """
+        if extra_blocked or extra_open:
+            return self.find_paths_to_edge([start_location], target_edge, extra_blocked, extra_open)[0]
+
         if self.contains_stationary_unit(start_location):
             self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
             return
@@ -495,8 +624,158 @@ class GameState:
         if target_edge is None:
             target_edge = self.get_target_edge(start_location)
 
-        end_points = self.game_map.get_edge_locations(target_edge)
-        return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
+        board_version = self._sync_path_cache()
+
+        key = ((int(start_location[0]), int(start_location[1])), target_edge, board_version)
+        path = self._path_cache.get(key)
+        if path is None:
+            self.path_cache_misses += 1
+            end_points = self.game_map.get_edge_locations(target_edge)
+            path = self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
+            if path is None:
+                return
+            self._path_cache[key] = path
+        else:
+            self.path_cache_hits += 1
+        return [list(location) for location in path]
+
+    def find_paths_to_edge(self, start_locations, target_edge=None, extra_blocked=None, extra_open=None):
+        """Gets the paths units at many locations would take, sharing one path-finding pass between them.
+        Equivalent to calling find_path_to_edge for each location, but much faster when scoring many spawn points.
+
+        Args:
+            start_locations: A list of locations of hypothetical units
+            target_edge: The edge the units want to reach. game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc. Induced from each start location if None.
+            extra_blocked: A list of locations to treat as holding structures, to test hypothetical walls without changing the game map
+            extra_open: A list of locations to treat as empty, to test removing structures without changing the game map
+
+        Returns:
+            A list with the path for each start location, in the same order. Blocked start locations get None.
+
+        """
+        if extra_blocked or extra_open:
+            # Hypothetical boards are never cached, every candidate layout is usually only scored once
+            paths = self._shortest_path_finder.paths_from_all(start_locations, target_edge, self, extra_blocked, extra_open)
+            for start_location, path in zip(start_locations, paths):
+                if path is None:
+                    self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+            return paths
+
+        board_version = self._sync_path_cache()
+
+        paths = [None] * len(start_locations)
+        keys = [None] * len(start_locations)
+        missing = []
+        for index, start_location in enumerate(start_locations):
+            if self.contains_stationary_unit(start_location):
+                self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+                continue
+            edge = self.get_target_edge(start_location) if target_edge is None else target_edge
+            keys[index] = ((int(start_location[0]), int(start_location[1])), edge, board_version)
+            paths[index] = self._path_cache.get(keys[index])
+            if paths[index] is None:
+                missing.append(index)
+            else:
+                self.path_cache_hits += 1
+
+        if missing:
+            self.path_cache_misses += len(missing)
+            found = self._shortest_path_finder.paths_from_all([start_locations[index] for index in missing], target_edge, self)
+            for index, path in zip(missing, found):
+                paths[index] = path
+                if path is not None:
+                    self._path_cache[keys[index]] = path
+
+        return [None if path is None else [list(location) for location in path] for path in paths]
+
+    def frames_per_move(self, unit_type):
+        """Gets how many frames a mobile unit of a given type stays on each location of its path
+
+        Args:
+            unit_type: The type of mobile unit
+
+        Returns:
+            The number of frames between moves, 1 / speed from the unit's config. None for structures and invalid types
+
+        """
+        if unit_type not in ALL_UNITS or is_stationary(unit_type):
+            self.warn("Invalid unit type {} for timed pathing, only mobile units move".format(unit_type))
+            return
+        speed = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[unit_type]].get("speed", 0)
+        if speed <= 0:
+            self.warn("Unit type {} has no speed in the config".format(unit_type))
+            return
+        return max(1, int(round(1 / speed)))
+
+    def find_timed_path_to_edge(self, start_location, unit_type, target_edge=None, extra_blocked=None, extra_open=None):
+        """Gets the path a unit of a given type would take, with the frames it would spend on each location
+
+        Args:
+            start_location: The location of a hypothetical unit
+            unit_type: The type of the hypothetical unit, which sets how fast it moves
+            target_edge: The edge the unit wants to reach. Induced from start_location if None.
+            extra_blocked: A list of locations to treat as holding structures, see find_path_to_edge
+            extra_open: A list of locations to treat as empty, see find_path_to_edge
+
+        Returns:
+            A list of (location, enter_frame, exit_frame) tuples along the path the unit would take. 
+            The unit is on the location from enter_frame up to but not including exit_frame.
+
+        """
+        frames_per_move = self.frames_per_move(unit_type)
+        if frames_per_move is None:
+            return
+        return timed_path(self.find_path_to_edge(start_location, target_edge, extra_blocked, extra_open), frames_per_move)
+
+    def find_timed_paths_to_edge(self, start_locations, unit_types, target_edge=None, extra_blocked=None, extra_open=None):
+        """Gets timed paths for every combination of start location and unit type.
+        Each start location's path is only computed once and shared by all unit types, since speed does not change the path.
+
+        Args:
+            start_locations: A list of locations of hypothetical units
+            unit_types: A list of mobile unit types
+            target_edge: The edge the units want to reach. Induced from each start location if None.
+            extra_blocked: A list of locations to treat as holding structures, see find_path_to_edge
+            extra_open: A list of locations to treat as empty, see find_path_to_edge
+
+        Returns:
+            A list with one dict per start location, in the same order, mapping each unit type to its timed path. 
+            See find_timed_path_to_edge for the format. Blocked start locations get None for every unit type.
+
+        """
+        frames = {unit_type: self.frames_per_move(unit_type) for unit_type in unit_types}
+        frames = {unit_type: frames_per_move for unit_type, frames_per_move in frames.items() if frames_per_move is not None}
+        paths = self.find_paths_to_edge(start_locations, target_edge, extra_blocked, extra_open)
+        return [{unit_type: timed_path(path, frames_per_move) for unit_type, frames_per_move in frames.items()} for path in paths]
+
+    def as_arrays(self):
+        """Gets the board as NumPy arrays of structure type, owner, health, max health, upgraded and 
+        pending removal flags, and mobile unit counts per player and type. Needs numpy.
+
+        The arrays are kept in sync with attempt_spawn, attempt_upgrade and GameMap edits, so region 
+        statistics become array reductions, for example as_arrays().health[:, 14:].sum() for the health of the top half.
+
+        Returns:
+            A board_arrays.BoardArrays, see GameMap.as_arrays
+
+        """
+        return self.game_map.as_arrays()
+
+    def _sync_path_cache(self):
+        """Drops cached paths computed for an older board version and returns the current one
+        """
+        board_version = self.game_map.board_version
+        if board_version != self._path_cache_version:
+            self._path_cache.clear()
+            self._path_cache_version = board_version
+        return board_version
+
+    @property
+    def board_version(self):
+        """The structure version of the board. 
+        It changes whenever structures are spawned, removed, flagged for removal or upgraded, and is used to invalidate cached paths and threat fields.
+        """
+        return self.game_map.board_version
 
     def contains_stationary_unit(self, location):
         """Check if a location is blocked, return structures unit if it is
@@ -508,13 +787,11 @@ class GameState:
             A structures unit if there is a stationary unit at the location, False otherwise
             
         """
+        unit = self.game_map.structure_at(location)
+        if unit is not None:
+            return unit
         if not self.game_map.in_arena_bounds(location):
             self.warn('Checked for stationary unit outside of arena bounds')
-            return False
-        x, y = map(int, location)
-        for unit in self.game_map[x,y]:
-            if unit.stationary:
-                return unit
         return False
 
     def warn(self, message):
@@ -533,7 +810,7 @@ class GameState:
         """
 
         self.enable_warnings = not suppress
-        self.game_map.enable_warnings = not suppress
+        self._game_map.enable_warnings = not suppress
 
     def get_target(self, attacking_unit):
         """Returns target of given unit based on current map of the game board. 
@@ -555,7 +832,7 @@ class GameState:
             return
 
         attacker_location = [attacking_unit.x, attacking_unit.y]
-        possible_locations = self.game_map.get_locations_in_range(attacker_location, attacking_unit.attackRange)
+        possible_locations = self.game_map.locations_in_range(attacker_location, attacking_unit.attackRange)
         target = None
         target_stationary = True
         target_distance = sys.maxsize
@@ -614,6 +891,74 @@ class GameState:
                     target_x_distance = unit_x_distance
         return target
 
+    def get_targets(self, attacking_units):
+        """Gets the targets of many units at once, with the same rules as get_target. Needs numpy.
+
+        Every unit on the map is gathered once and every attacker's target is then picked with vectorized 
+        comparisons, which is much faster than calling get_target for each turret and mobile unit of a frame.
+
+        Args:
+            attacking_units: A list of GameUnits
+
+        Returns:
+            A list with the GameUnit each unit would choose to attack, or None, in the same order
+
+        """
+        units, x, y, player_index, stationary, health = candidate_arrays(self.game_map)
+        targets = select_targets(
+            [unit.x for unit in attacking_units], [unit.y for unit in attacking_units],
+            [unit.player_index for unit in attacking_units], [unit.attackRange for unit in attacking_units],
+            [unit.damage_f for unit in attacking_units], [unit.damage_i for unit in attacking_units],
+            x, y, player_index, stationary, health, self.config["unitInformation"][0]["getHitRadius"])
+        return [units[target] if target >= 0 else None for target in targets.tolist()]
+
+    def threat_field(self, player_index):
+        """Gets the damage per frame the other player's structures deal to player_index's mobile units on every location
+
+        The field is computed once and then only updated for the structures that changed since the last call, 
+        so scoring many paths costs a lookup per location instead of a get_attackers call::
+
+            field = game_state.threat_field(0)
+            damages = [field.exposure(path) for path in game_state.find_paths_to_edge(locations)]
+
+        Args:
+            player_index: The index corresponding to the defending player, 0 for you 1 for the enemy
+
+        Returns:
+            A threat.ThreatField. It is shared with later calls, treat it as read only
+
+        """
+        return self.__structure_field(ThreatField, player_index)
+
+    def shield_field(self, player_index):
+        """Gets the shield player_index's supports give that player's mobile units on every location
+
+        Like threat_field, the field is computed once and then only updated for the supports that changed. 
+        Upgraded supports with a shieldBonusPerY give more shield the further forward of their owner's edge they are::
+
+            field = game_state.shield_field(0)
+            shields = [field.path_shield(path) for path in game_state.find_paths_to_edge(locations)]
+
+        Args:
+            player_index: The index corresponding to the player whose units are shielded, 0 for you 1 for the enemy
+
+        Returns:
+            A threat.ShieldField. It is shared with later calls, treat it as read only
+
+        """
+        return self.__structure_field(ShieldField, player_index)
+
+    def __structure_field(self, field_type, player_index):
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+        field = self._structure_fields.get((field_type, player_index))
+        if field is None:
+            field = self._structure_fields[(field_type, player_index)] = field_type(player_index)
+        game_map = self.game_map
+        if field.board_version != game_map.board_version or field._game_map is not game_map:
+            field.update(game_map)
+        return field
+
     def get_attackers(self, location, player_index):
         """Gets the stationary units threatening a given location
 
@@ -639,9 +984,44 @@ class GameState:
         for unit in self.config["unitInformation"]:
             if unit.get('attackRange', 0) >= max_range:
                 max_range = unit.get('attackRange', 0)
-        possible_locations= self.game_map.get_locations_in_range(location, max_range)
+        possible_locations = self.game_map.locations_in_range(location, max_range)
         for location_unit in possible_locations:
             for unit in self.game_map[location_unit]:
                 if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
                     attackers.append(unit)
         return attackers
+
+
+class Transaction:
+    """Undoes changes made to a GameState, see GameState.transaction
+
+    Attributes :
+        * game_state (:obj: GameState): The game state the changes are made to
+
+    """
+    def __init__(self, game_state):
+        self.game_state = game_state
+        self._mark = None
+
+    def __enter__(self):
+        game_state = self.game_state
+        self._mark = game_state.game_map._undo_mark()
+        self._resources = [dict(resources) for resources in game_state._player_resources]
+        self._stack_sizes = (len(game_state._build_stack), len(game_state._deploy_stack))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.rollback()
+        self.game_state.game_map._undo_release(self._mark)
+        return False
+
+    def rollback(self):
+        """Undoes every change made since the transaction started. The transaction stays open
+        """
+        game_state = self.game_state
+        game_state.game_map._undo_to(self._mark)
+        game_state._player_resources = [dict(resources) for resources in self._resources]
+        build_size, deploy_size = self._stack_sizes
+        del game_state._build_stack[build_size:]
+        del game_state._deploy_stack[deploy_size:]
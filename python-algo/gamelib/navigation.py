@@ -2,7 +2,110 @@ import heapq
 import math
 import sys
 import queue
+from array import array
+from collections import deque
 from .util import debug_write
+from .game_map import ARENA_CELLS, IN_BOUNDS
+from . import bitboard
+
+ARENA_SIZE = 28
+HALF_ARENA = 14
+
+"""
+Every location inside the diamond gets a cell id, in the same order GameMap iterates
+(bottom row first, left to right). Path-finders index flat arrays with these ids
+instead of allocating a grid of Nodes.
+"""
+CELL_ID = array('h', [-1]) * (ARENA_SIZE * ARENA_SIZE)
+CELL_X = array('b')
+CELL_Y = array('b')
+for _x, _y in ARENA_CELLS:
+    CELL_ID[_x * ARENA_SIZE + _y] = len(CELL_X)
+    CELL_X.append(_x)
+    CELL_Y.append(_y)
+NUM_CELLS = len(CELL_X)
+
+
+def cell_id(location):
+    """Gets the cell id of a location
+
+    Args:
+        location: A map location
+
+    Returns:
+        The cell id of the location, or -1 if it is outside the arena
+
+    """
+    x, y = location
+    x = int(x)
+    y = int(y)
+    if x < 0 or y < 0 or x >= ARENA_SIZE or y >= ARENA_SIZE:
+        return -1
+    return CELL_ID[x * ARENA_SIZE + y]
+
+
+def overlay_cells(locations):
+    """Gets the cell ids of the in-arena locations in a list of locations
+
+    Args:
+        locations: A list of locations, or None
+
+    Returns:
+        A list of cell ids
+
+    """
+    if not locations:
+        return []
+    cells = [cell_id(location) for location in locations]
+    return [cell for cell in cells if cell != -1]
+
+
+def timed_path(path, frames_per_move):
+    """Adds frame timings to a path
+
+    Args:
+        path: A list of locations, as returned by find_path_to_edge
+        frames_per_move: The number of frames the unit waits on a location before moving on
+
+    Returns:
+        A list of (location, enter_frame, exit_frame) tuples, one per location of the path.
+        The unit is on the location from enter_frame up to but not including exit_frame,
+        and the first location is entered on frame 0. None if path is None.
+
+    """
+    if path is None:
+        return None
+    return [(location, index * frames_per_move, (index + 1) * frames_per_move) for index, location in enumerate(path)]
+
+
+def _neighbor_ids(cell):
+    x = CELL_X[cell]
+    y = CELL_Y[cell]
+    neighbors = []
+    # Same order as NodePathFinder._get_neighbors: up, down, right, left
+    for nx, ny in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)):
+        if 0 <= nx < ARENA_SIZE and 0 <= ny < ARENA_SIZE and IN_BOUNDS[nx][ny]:
+            neighbors.append(CELL_ID[nx * ARENA_SIZE + ny])
+    return tuple(neighbors)
+
+NEIGHBORS = tuple(_neighbor_ids(_cell) for _cell in range(NUM_CELLS))
+
+
+def _idealness_table(direction):
+    table = array('h')
+    for cell in range(NUM_CELLS):
+        x = CELL_X[cell]
+        y = CELL_Y[cell]
+        idealness = 28 * y if direction[1] == 1 else 28 * (27 - y)
+        idealness += x if direction[0] == 1 else 27 - x
+        table.append(idealness)
+    return table
+
+IDEALNESS = {direction: _idealness_table(direction) for direction in ((1, 1), (-1, 1), (-1, -1), (1, -1))}
+
+_ZEROS = bytes(NUM_CELLS)
+_UNVISITED = array('h', [-1]) * NUM_CELLS
+
 
 class Node:
     """A path-finding node
@@ -28,6 +131,312 @@ code to maximise time efficiency
 class ShortestPathFinder:
     """Handles path-finding
 
+    The board is held in flat arrays indexed by cell id (see CELL_ID) which are allocated
+    once and reset between searches, so repeated path queries do not allocate a grid.
+
+    Attributes :
+        * HORIZONTAL (int): A constant representing a horizontal movement
+        * VERTICAL (int): A constant representing a vertical movement
+
+        * game_state (:obj: GameState): The current gamestate
+        * blocked (bytearray): 1 for every cell id that holds a structure
+        * pathlength (array): The distance between each cell and the target location, -1 if unreached
+
+    """
+    def __init__(self):
+        self.HORIZONTAL = 1
+        self.VERTICAL = 2
+        self.initialized = False
+        self.game_state = None
+        self.blocked = bytearray(NUM_CELLS)
+        self.pathlength = array('h', _UNVISITED)
+
+    def initialize_map(self, game_state, extra_blocked=None, extra_open=None):
+        """Initializes the map
+
+        Args:
+            game_state: A GameState object representing the gamestate we want to traverse
+            extra_blocked: Locations to treat as holding a structure, whether or not they do
+            extra_open: Locations to treat as empty, whether or not they hold a structure. extra_blocked wins if a location is in both
+        """
+        self.initialized = True
+        self.game_state = game_state
+        blocked = self.blocked
+        blocked[:] = _ZEROS
+        for x, y in game_state.game_map.structure_locations():
+            blocked[CELL_ID[x * ARENA_SIZE + y]] = 1
+        for cell in overlay_cells(extra_open):
+            blocked[cell] = 0
+        for cell in overlay_cells(extra_blocked):
+            blocked[cell] = 1
+
+    def navigate_multiple_endpoints(self, start_point, end_points, game_state, extra_blocked=None, extra_open=None):
+        """Finds the path a unit would take to reach a set of endpoints
+
+        Args:
+            * start_point: The starting location of the unit
+            * end_points: The end points of the unit, should be a list of edge locations
+            * game_state: The current game state
+            * extra_blocked: Hypothetical structure locations to path around, the game state is not changed
+            * extra_open: Locations to path through as if their structures were gone, the game state is not changed
+
+        Returns:
+            The path a unit at start_point would take when trying to reach end_points given the current game state.
+            Note that this path can change if a tower is destroyed during pathing, or if you or your enemy places structures.
+
+        """
+        start = cell_id(start_point)
+        if start == -1:
+            return
+
+        self.initialize_map(game_state, extra_blocked, extra_open)
+        if self.blocked[start]:
+            return
+        end_cells = [cell for cell in map(cell_id, end_points) if cell != -1]
+        direction = self._get_direction_from_endpoints(end_points)
+        ideal_cell = self._idealness_search(start, end_cells, direction)
+        self._validate(ideal_cell, end_cells)
+        return self._get_path(start_point, direction, self.pathlength)
+
+    def paths_from_all(self, start_points, target_edge, game_state, extra_blocked=None, extra_open=None):
+        """Finds the paths units at many start points would take
+
+        The distance field of each target edge is computed once and shared by every start point
+        whose pocket of pathable space reaches that edge. The idealness search and self destruct
+        field are only computed once per distinct pocket that cannot reach its edge.
+
+        Args:
+            * start_points: A list of starting locations
+            * target_edge: The edge every unit wants to reach. Induced from each start point if None
+            * game_state: The current game state
+            * extra_blocked: Hypothetical structure locations to path around, the game state is not changed
+            * extra_open: Locations to path through as if their structures were gone, the game state is not changed
+
+        Returns:
+            A list with the path for each start point, in the same order as start_points.
+            The path is None for start points that are blocked or outside the arena.
+
+        """
+        self.initialize_map(game_state, extra_blocked, extra_open)
+        blocked = self.blocked
+        edges = game_state.game_map.get_edges()
+        paths = [None] * len(start_points)
+
+        open_cells = bitboard.ARENA & ~bitboard.from_cells(blocked)
+        starts_by_edge = {}
+        for index, start_point in enumerate(start_points):
+            start = cell_id(start_point)
+            if start == -1 or blocked[start]:
+                continue
+            edge = game_state.get_target_edge(start_point) if target_edge is None else target_edge
+            starts_by_edge.setdefault(edge, []).append((index, start))
+
+        for edge, starts in starts_by_edge.items():
+            end_points = edges[edge]
+            end_cells = [cell_id(location) for location in end_points]
+            direction = self._get_direction_from_endpoints(end_points)
+            end_board = 0
+            for cell in end_cells:
+                end_board |= bitboard.CELL_BITS[cell]
+
+            # Starts in the same pocket of pathable space share its idealness search
+            pockets = []
+            starts_by_pocket = []
+            for index, start in starts:
+                start_bit = bitboard.CELL_BITS[start]
+                for number, pocket in enumerate(pockets):
+                    if pocket[0] & start_bit:
+                        break
+                else:
+                    pockets.append(self._flood_pocket(start, open_cells, end_board, direction))
+                    starts_by_pocket.append([])
+                    number = len(pockets) - 1
+                starts_by_pocket[number].append((index, start))
+
+            edge_field = None
+            for (pocket, reaches_edge, most_ideal), pocket_starts in zip(pockets, starts_by_pocket):
+                if not reaches_edge:
+                    self._validate(most_ideal, end_cells)
+                elif edge_field is None:
+                    self._validate(end_cells[0], end_cells)
+                    edge_field = array('h', self.pathlength)
+                else:
+                    self.pathlength[:] = edge_field
+                for index, start in pocket_starts:
+                    paths[index] = self._get_path(start_points[index], direction, self.pathlength)
+
+        return paths
+
+    def _flood_pocket(self, start, open_cells, end_board, direction):
+        """Flood fills the pocket of pathable space containing start
+
+        Args:
+            * start: The cell id to fill from
+            * open_cells: A bitboard of the cells units can walk on
+            * end_board: A bitboard of the end cells
+            * direction: The direction of the target edge
+
+        Returns:
+            A tuple (pocket, reaches_edge, most_ideal), where pocket is a bitboard of the pocket's cells
+            and most_ideal is the best self destruct cell of the pocket
+
+        """
+        pocket = bitboard.flood_fill(bitboard.CELL_BITS[start], open_cells)
+        if pocket & end_board:
+            return pocket, True, start
+        return pocket, False, bitboard.most_ideal(pocket, direction)
+
+    def _idealness_search(self, start, end_cells, direction):
+        """
+        Finds the most ideal tile in our 'pocket' of pathable space. 
+        The edge if it is available, or the best self destruct location otherwise
+        """
+        end_board = 0
+        for cell in end_cells:
+            end_board |= bitboard.CELL_BITS[cell]
+        if end_board & bitboard.CELL_BITS[start]:
+            return start
+
+        pocket = bitboard.flood_fill(bitboard.CELL_BITS[start], bitboard.ARENA & ~bitboard.from_cells(self.blocked))
+        if pocket & end_board:
+            return bitboard.lowest_cell(pocket & end_board)
+        return bitboard.most_ideal(pocket, direction)
+
+    def _validate(self, ideal_cell, end_cells):
+        """Breadth first search of the grid, setting the pathlengths of each cell
+
+        """
+        blocked = self.blocked
+        pathlength = self.pathlength
+        pathlength[:] = _UNVISITED
+        if ideal_cell in end_cells:
+            # Blocked edge cells can never be stepped on, so only the open ones seed the search
+            seeds = [cell for cell in end_cells if not blocked[cell]]
+        else:
+            seeds = [ideal_cell]
+        for cell in seeds:
+            pathlength[cell] = 0
+
+        current = deque(seeds)
+        while current:
+            current_cell = current.popleft()
+            next_length = pathlength[current_cell] + 1
+            for neighbor in NEIGHBORS[current_cell]:
+                if not blocked[neighbor] and pathlength[neighbor] == -1:
+                    pathlength[neighbor] = next_length
+                    current.append(neighbor)
+
+    def _get_path(self, start_point, direction, pathlength, move_direction=0):
+        """Once all cells are validated, and a target is found, the unit can path to its target
+        by walking down the given pathlength field
+
+        """
+        path = [start_point]
+        current = cell_id(start_point)
+
+        while not pathlength[current] == 0:
+            next_move = self._choose_next_move(current, move_direction, direction, pathlength)
+            if CELL_X[current] == CELL_X[next_move]:
+                move_direction = self.VERTICAL
+            else:
+                move_direction = self.HORIZONTAL
+            path.append([CELL_X[next_move], CELL_Y[next_move]])
+            current = next_move
+
+        return path
+
+    def _choose_next_move(self, current_cell, previous_move_direction, direction, pathlength):
+        """Given the current cell and adjacent cells, return the best 'next step' for a given unit to take
+        """
+        blocked = self.blocked
+        ideal_neighbor = current_cell
+        best_pathlength = pathlength[current_cell]
+        for neighbor in NEIGHBORS[current_cell]:
+            if blocked[neighbor]:
+                continue
+
+            current_pathlength = pathlength[neighbor]
+            if current_pathlength > best_pathlength:
+                continue
+            if current_pathlength == best_pathlength and not self._better_direction(current_cell, neighbor, ideal_neighbor, previous_move_direction, direction):
+                continue
+
+            ideal_neighbor = neighbor
+            best_pathlength = current_pathlength
+
+        return ideal_neighbor
+
+    def _better_direction(self, prev_cell, new_cell, prev_best, previous_move_direction, direction):
+        """Compare two cells and return True if the unit would rather move to the new one
+
+        """
+        prev_x, prev_y = CELL_X[prev_cell], CELL_Y[prev_cell]
+        new_x, new_y = CELL_X[new_cell], CELL_Y[new_cell]
+        best_x, best_y = CELL_X[prev_best], CELL_Y[prev_best]
+        #True if we are moving in a different direction than prev move and prev is not
+        #If we previously moved horizontal, and now one of our options has a different x position then the other (the two options are not up/down)
+        if previous_move_direction == self.HORIZONTAL and not new_x == best_x:
+            #We want to go up now. If we have not changed our y, we are not going up
+            return not prev_y == new_y
+        if previous_move_direction == self.VERTICAL and not new_y == best_y:
+            return not prev_x == new_x
+        if previous_move_direction == 0:
+            return not prev_y == new_y
+
+        #To make it here, both moves are on the same axis 
+        if new_y == best_y: #If they both moved horizontal...
+            return (direction[0] == 1 and new_x > best_x) or (direction[0] == -1 and new_x < best_x)
+        if new_x == best_x: #If they both moved vertical...
+            return (direction[1] == 1 and new_y > best_y) or (direction[1] == -1 and new_y < best_y)
+        return True
+
+    def _get_direction_from_endpoints(self, end_points):
+        """Gets the direction of a set of endpoints
+
+        Args:
+            * end_points: A set of endpoints, should be an edge 
+
+        Returns:
+            A direction (x,y) representing the edge. For example, (1,1) for the top right and (-1, 1) for the top left
+
+        """
+        x, y = end_points[0]
+        return (-1 if x < HALF_ARENA else 1, -1 if y < HALF_ARENA else 1)
+
+    def print_map(self):
+        """Prints an ASCII version of the current game map for debug purposes
+
+        """
+        if not self.initialized:
+            debug_write("Attempted to print_map before pathfinder initialization. Use 'this_object.initialize_map(game_state)' to initialize the map first")
+            return
+
+        for y in range(ARENA_SIZE):
+            for x in range(ARENA_SIZE):
+                cell = cell_id([x, ARENA_SIZE - y - 1])
+                if cell != -1 and not self.blocked[cell] and not self.pathlength[cell] == -1:
+                    _print_justified(self.pathlength[cell])
+                else:
+                    sys.stderr.write("   ")
+            debug_write("")
+
+
+def _print_justified(number):
+    """Prints a number between 100 and -10 in 3 spaces
+
+    """
+    if number < 10 and number > -1:
+        sys.stderr.write(" ")
+    sys.stderr.write(str(number))
+    sys.stderr.write(" ")
+
+
+class NodePathFinder:
+    """The original Node based path-finder.
+
+    It builds a fresh grid of Nodes on every call, which makes it slow, but it is kept
+    as the reference implementation that ShortestPathFinder is tested against.
+
     Attributes :
         * HORIZONTAL (int): A constant representing a horizontal movement
         * VERTICAL (int): A constant representing a vertical movement
@@ -0,0 +1,212 @@
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .navigation import ShortestPathFinder, ARENA_SIZE, CELL_X, CELL_Y, NUM_CELLS, IDEALNESS, cell_id
+
+# NumPy is optional. Everything in this module needs it, but the rest of gamelib does not,
+# and ShortestPathFinder remains the reference implementation.
+if np is not None:
+    # Flat x * ARENA_SIZE + y index of every cell id, the cell id of every grid position,
+    # and the idealness of every cell laid out on the grid
+    CELL_INDEX = np.array([x * ARENA_SIZE + y for x, y in zip(CELL_X, CELL_Y)], dtype=np.intp)
+    CELL_ID_GRID = np.full(ARENA_SIZE * ARENA_SIZE, -1, dtype=np.int16)
+    CELL_ID_GRID[CELL_INDEX] = np.arange(NUM_CELLS, dtype=np.int16)
+    CELL_ID_GRID = CELL_ID_GRID.reshape(ARENA_SIZE, ARENA_SIZE)
+    ARENA_MASK = np.zeros(ARENA_SIZE * ARENA_SIZE, dtype=bool)
+    ARENA_MASK[CELL_INDEX] = True
+    ARENA_MASK = ARENA_MASK.reshape(ARENA_SIZE, ARENA_SIZE)
+    IDEALNESS_GRIDS = {}
+    for _direction, _table in IDEALNESS.items():
+        _grid = np.full(ARENA_SIZE * ARENA_SIZE, -1, dtype=np.int32)
+        _grid[CELL_INDEX] = _table
+        IDEALNESS_GRIDS[_direction] = _grid.reshape(ARENA_SIZE, ARENA_SIZE)
+
+
+def wavefront(seeds, open_mask):
+    """Breadth first distances computed a whole frontier at a time with shifted boolean arrays
+
+    Both arguments may have leading batch dimensions, for example (edges, 28, 28), in which case
+    every board in the batch is expanded together, for little more than the cost of one.
+
+    Args:
+        seeds: Boolean array, True where the distance is 0
+        open_mask: Boolean array, True for cells units can walk on
+
+    Returns:
+        An int16 array of distances with the same shape, -1 where unreachable
+
+    """
+    open_mask = np.broadcast_to(open_mask, seeds.shape)
+    frontier = seeds & open_mask
+    # The frontier is kept in a grid with a one cell border, so each neighbor is a plain slice of it
+    padded = np.zeros(seeds.shape[:-2] + (seeds.shape[-2] + 2, seeds.shape[-1] + 2), dtype=bool)
+    padded[..., 1:-1, 1:-1] = frontier
+    unreached = open_mask & ~frontier
+    # Every cell gains 1 for each step it is still unreached after, which leaves reached cells at their distance
+    distance = np.zeros(seeds.shape, dtype=np.int16)
+    grown = np.empty(seeds.shape, dtype=bool)
+    while True:
+        np.logical_or(padded[..., :-2, 1:-1], padded[..., 2:, 1:-1], out=grown)
+        grown |= padded[..., 1:-1, :-2]
+        grown |= padded[..., 1:-1, 2:]
+        grown &= unreached
+        if not grown.any():
+            break
+        distance += unreached
+        unreached ^= grown
+        padded[..., 1:-1, 1:-1] = grown
+    distance[unreached | ~open_mask] = -1
+    return distance
+
+
+class NumpyPathFinder(ShortestPathFinder):
+    """A path-finder that computes its distance fields and pockets with NumPy
+
+    The board is held as a boolean blocked mask and each search expands a whole wavefront
+    per step instead of visiting cells one by one from a queue. Paths are then walked
+    with the same direction tie-breaking as ShortestPathFinder, so both return identical paths.
+
+    A wavefront step costs about the same for one board as for several, so the distance fields of
+    all four edges are expanded together and kept until the structures change. Queries from many
+    start points on one board, through navigate_multiple_endpoints or paths_from_all, then only
+    walk the stored fields. The self destruct fields of pockets that cannot reach their edge are
+    also expanded together.
+
+    NumPy's fixed cost per step makes it slower than ShortestPathFinder whenever the board is new.
+    Measured on a 25% filled board: one query on a new board takes about 1.1 ms against 0.3 ms, and
+    paths_from_all over the 23 open bottom edge locations about 2.0 ms against 1.3 ms. It only pays
+    off for many separate queries on an unchanged board, where those 23 queries take about 3.3 ms
+    against 6.9 ms. Prefer IncrementalPathFinder when speed matters.
+
+    Attributes :
+        * blocked_mask (numpy.ndarray): 28x28 boolean array indexed [x, y], True for cells holding a structure
+
+    """
+    def __init__(self):
+        if np is None:
+            raise ImportError("NumpyPathFinder requires numpy, use ShortestPathFinder instead")
+        super().__init__()
+        self.blocked_mask = np.zeros((ARENA_SIZE, ARENA_SIZE), dtype=bool)
+        self._open_mask = ARENA_MASK.copy()
+        # The distance field of each edge, and the blocked cells they were expanded for
+        self._edge_fields = None
+        self._fields_blocked = None
+        self._edge_lookup = {}
+
+    def initialize_map(self, game_state, extra_blocked=None, extra_open=None):
+        """Initializes the map
+
+        See ShortestPathFinder.initialize_map for arguments.
+
+        """
+        super().initialize_map(game_state, extra_blocked, extra_open)
+        flat = np.zeros(ARENA_SIZE * ARENA_SIZE, dtype=bool)
+        flat[CELL_INDEX] = np.frombuffer(self.blocked, dtype=np.uint8).astype(bool)
+        self.blocked_mask = flat.reshape(ARENA_SIZE, ARENA_SIZE)
+        self._open_mask = ARENA_MASK & ~self.blocked_mask
+
+    def paths_from_all(self, start_points, target_edge, game_state, extra_blocked=None, extra_open=None):
+        """Finds the paths units at many start points would take, walking the stored edge fields
+
+        See ShortestPathFinder.paths_from_all for arguments and return value.
+
+        """
+        self.initialize_map(game_state, extra_blocked, extra_open)
+        edges = game_state.game_map.get_edges()
+        fields = self._fields(edges)
+        paths = [None] * len(start_points)
+        stranded = []
+        for index, start_point in enumerate(start_points):
+            start = cell_id(start_point)
+            if start == -1 or self.blocked[start]:
+                continue
+            edge = game_state.get_target_edge(start_point) if target_edge is None else target_edge
+            direction = self._get_direction_from_endpoints(edges[edge])
+            if fields[edge][start] == -1:
+                stranded.append((index, start, direction))
+            else:
+                paths[index] = self._get_path(start_point, direction, fields[edge])
+        if not stranded:
+            return paths
+
+        # Starts whose pocket cannot reach their edge head for the pocket's most ideal cell
+        seeds = np.zeros((len(stranded), ARENA_SIZE * ARENA_SIZE), dtype=bool)
+        seeds[np.arange(len(stranded)), CELL_INDEX[[start for _, start, _ in stranded]]] = True
+        pockets = wavefront(seeds.reshape(-1, ARENA_SIZE, ARENA_SIZE), self._open_mask) != -1
+        ideal_cells = [self._most_ideal(pocket, direction) for pocket, (_, _, direction) in zip(pockets, stranded)]
+        distinct = sorted(set(ideal_cells))
+        seeds = np.zeros((len(distinct), ARENA_SIZE * ARENA_SIZE), dtype=bool)
+        seeds[np.arange(len(distinct)), CELL_INDEX[distinct]] = True
+        distances = wavefront(seeds.reshape(-1, ARENA_SIZE, ARENA_SIZE), self._open_mask).reshape(len(distinct), -1)[:, CELL_INDEX]
+        ideal_fields = {cell: array('h', distance.tolist()) for cell, distance in zip(distinct, distances)}
+        for (index, _, direction), cell in zip(stranded, ideal_cells):
+            paths[index] = self._get_path(start_points[index], direction, ideal_fields[cell])
+        return paths
+
+    def _fields(self, edges):
+        """Gets the distance field of every edge for the current board, expanding all four together when it changed
+        """
+        blocked = bytes(self.blocked)
+        if self._edge_fields is None or blocked != self._fields_blocked:
+            seeds = np.zeros((len(edges), ARENA_SIZE * ARENA_SIZE), dtype=bool)
+            for edge, locations in enumerate(edges):
+                seeds[edge, [x * ARENA_SIZE + y for x, y in locations]] = True
+                self._edge_lookup[tuple(cell_id(location) for location in locations)] = edge
+            distances = wavefront(seeds.reshape(-1, ARENA_SIZE, ARENA_SIZE), self._open_mask).reshape(len(edges), -1)[:, CELL_INDEX]
+            self._edge_fields = [array('h', distance.tolist()) for distance in distances]
+            self._fields_blocked = blocked
+        return self._edge_fields
+
+    def _edge_field(self, end_cells):
+        """Gets the stored field of end_cells if they are a whole edge, None otherwise
+        """
+        fields = self._fields(self.game_state.game_map.get_edges())
+        edge = self._edge_lookup.get(tuple(end_cells))
+        return None if edge is None else fields[edge]
+
+    def _idealness_search(self, start, end_cells, direction):
+        """
+        Finds the most ideal tile in our 'pocket' of pathable space.
+        The edge if it is available, or the best self destruct location otherwise
+        """
+        field = self._edge_field(end_cells)
+        if field is not None:
+            if field[start] != -1:
+                return end_cells[0]
+            return self._most_ideal(self._pocket_mask(start), direction)
+        pocket = self._pocket_mask(start)
+        ends_in_pocket = pocket.ravel()[CELL_INDEX[end_cells]]
+        if ends_in_pocket.any():
+            return end_cells[int(np.argmax(ends_in_pocket))]
+        return self._most_ideal(pocket, direction)
+
+    def _validate(self, ideal_cell, end_cells):
+        """Wavefront search of the grid, setting the pathlengths of each cell
+
+        """
+        if ideal_cell in end_cells:
+            field = self._edge_field(end_cells)
+            if field is not None:
+                self.pathlength[:] = field
+                return
+        seeds = np.zeros(ARENA_SIZE * ARENA_SIZE, dtype=bool)
+        if ideal_cell in end_cells:
+            seeds[CELL_INDEX[end_cells]] = True
+        else:
+            seeds[CELL_INDEX[ideal_cell]] = True
+        distance = wavefront(seeds.reshape(ARENA_SIZE, ARENA_SIZE), self._open_mask)
+        self.pathlength = array('h', distance.ravel()[CELL_INDEX].tolist())
+
+    def _pocket_mask(self, start):
+        seeds = np.zeros((ARENA_SIZE, ARENA_SIZE), dtype=bool)
+        seeds[CELL_X[start], CELL_Y[start]] = True
+        return wavefront(seeds, self._open_mask) != -1
+
+    def _most_ideal(self, pocket, direction):
+        idealness = np.where(pocket, IDEALNESS_GRIDS[direction], -1)
+        x, y = np.unravel_index(int(np.argmax(idealness)), idealness.shape)
+        return int(CELL_ID_GRID[x, y])
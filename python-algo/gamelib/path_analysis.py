@@ -0,0 +1,161 @@
+from array import array
+from collections import namedtuple
+
+from . import bitboard
+from .navigation import NEIGHBORS, NUM_CELLS, CELL_X, CELL_Y, cell_id
+from .pathing import IncrementalPathFinder
+
+"""
+One row of a PathSensitivity table.
+
+    * location (tuple): The empty cell that was hypothetically blocked
+    * changed_starts (tuple): Indices into PathSensitivity.starts of the spawn points whose path changes
+    * path_lengths (tuple): The number of cells in each start's path with this cell blocked, None if the start has no path
+    * exposures (tuple): The damage per frame summed along each start's path with this cell blocked, None if the start has no path
+"""
+CellSensitivity = namedtuple("CellSensitivity", ["location", "changed_starts", "path_lengths", "exposures"])
+
+
+class PathSensitivity:
+    """Which empty cells on a player's half change the paths enemy units take when blocked
+
+    Build one with path_sensitivity(game_state).
+
+    Attributes :
+        * player_index (int): The defending player whose half was analysed
+        * starts (list): The enemy spawn locations that were analysed
+        * base_paths (list): The current path from each start
+        * base_lengths (tuple): The number of cells in each current path
+        * base_exposures (tuple): The damage per frame of the defender's structures summed along each current path
+        * cells (dict): Maps each empty (x, y) on the defender's half to its CellSensitivity
+
+    """
+    def __init__(self, player_index, starts, base_paths, base_lengths, base_exposures, cells):
+        self.player_index = player_index
+        self.starts = starts
+        self.base_paths = base_paths
+        self.base_lengths = base_lengths
+        self.base_exposures = base_exposures
+        self.cells = cells
+
+    def __getitem__(self, location):
+        return self.cells[(int(location[0]), int(location[1]))]
+
+    def critical_cells(self):
+        """Gets the cells whose blocking changes at least one enemy path
+
+        Returns:
+            A list of CellSensitivity, most changed paths first
+
+        """
+        critical = [row for row in self.cells.values() if row.changed_starts]
+        critical.sort(key=lambda row: len(row.changed_starts), reverse=True)
+        return critical
+
+
+def path_sensitivity(game_state, player_index=0, path_finder=None):
+    """Works out, for every empty cell on a player's half, how blocking it would change the paths
+    enemy units take from each of their spawn locations.
+
+    Instead of running a full path search per cell and start, the current distance field of each
+    target edge is copied and repaired locally around the blocked cell, and only paths that can
+    be affected by the repaired region are walked again.
+
+    Args:
+        game_state: The current GameState
+        player_index: The defending player, 0 for you 1 for the enemy. Enemy units spawn on the opposite player's edges
+        path_finder: An IncrementalPathFinder to reuse, for example AlgoCore.path_finder. A new one is used if None
+
+    Returns:
+        A PathSensitivity table
+
+    """
+    if path_finder is None:
+        path_finder = IncrementalPathFinder()
+    path_finder.update(game_state)
+    game_map = game_state.game_map
+    blocked = path_finder.blocked
+    edges = game_map.get_edges()
+    scratch = path_finder._scratch
+
+    if player_index == 0:
+        spawn_edges = [game_map.TOP_LEFT, game_map.TOP_RIGHT]
+    else:
+        spawn_edges = [game_map.BOTTOM_LEFT, game_map.BOTTOM_RIGHT]
+    starts = [location for edge in spawn_edges for location in edges[edge] if not blocked[cell_id(location)]]
+    threat = game_state.threat_field(1 - player_index)
+    open_cells = bitboard.ARENA & ~bitboard.from_cells(blocked)
+
+    # Group the starts by target edge and note which pocket the self destructing ones are stuck in
+    groups = {}
+    stuck_pockets = {}
+    base_paths = path_finder.paths_from_all(starts, None, game_state)
+    for index, start in enumerate(starts):
+        edge = game_state.get_target_edge(start)
+        groups.setdefault(edge, []).append(index)
+        if path_finder.fields[edge][cell_id(start)] == -1:
+            stuck_pockets[index] = bitboard.flood_fill(bitboard.CELL_BITS[cell_id(start)], open_cells)
+    halos = [_halo(path) for path in base_paths]
+    base_lengths = tuple(len(path) for path in base_paths)
+    base_exposures = tuple(threat.exposure(path) for path in base_paths)
+
+    cells = {}
+    half = range(0, game_state.HALF_ARENA) if player_index == 0 else range(game_state.HALF_ARENA, game_state.ARENA_SIZE)
+    for cell in range(NUM_CELLS):
+        if blocked[cell] or CELL_Y[cell] not in half:
+            continue
+        location = (CELL_X[cell], CELL_Y[cell])
+        paths = list(base_paths)
+        changed = []
+        added, removed = path_finder._apply_overlay([location], None)
+        try:
+            for edge, indices in groups.items():
+                base_field = path_finder.fields[edge]
+                invalidated = None
+                field = None
+                direction = path_finder._get_direction_from_endpoints(edges[edge])
+                for index in indices:
+                    if index in stuck_pockets:
+                        if not stuck_pockets[index] & bitboard.CELL_BITS[cell]:
+                            continue
+                        path = scratch.navigate_multiple_endpoints(starts[index], edges[edge], game_state, [location])
+                    else:
+                        if base_field[cell] == -1:
+                            continue
+                        if field is None:
+                            field = array('h', base_field)
+                            invalidated = path_finder._repair(field, path_finder._edge_masks[edge], added, removed)
+                        if not invalidated and cell not in halos[index]:
+                            continue
+                        if field[cell_id(starts[index])] == -1:
+                            path = scratch.navigate_multiple_endpoints(starts[index], edges[edge], game_state, [location])
+                        else:
+                            path = path_finder._get_path(starts[index], direction, field)
+                    if path != base_paths[index]:
+                        paths[index] = path
+                        changed.append(index)
+        finally:
+            path_finder._remove_overlay(added, removed)
+
+        if changed:
+            path_lengths = tuple(None if path is None else len(path) for path in paths)
+            exposures = tuple(threat.exposure(path) for path in paths)
+        else:
+            path_lengths = base_lengths
+            exposures = base_exposures
+        cells[location] = CellSensitivity(location, tuple(sorted(changed)), path_lengths, exposures)
+
+    return PathSensitivity(player_index, starts, base_paths, base_lengths, base_exposures, cells)
+
+
+def _halo(path):
+    """The cells of a path and their neighbors. Blocking a cell outside of it cannot change the path
+    unless it changes the distance field
+    """
+    halo = set()
+    for location in path or []:
+        cell = cell_id(location)
+        halo.add(cell)
+        halo.update(NEIGHBORS[cell])
+    return halo
+
@@ -0,0 +1,292 @@
+import heapq
+from array import array
+
+from .navigation import ShortestPathFinder, NEIGHBORS, NUM_CELLS, cell_id, overlay_cells
+
+class IncrementalPathFinder(ShortestPathFinder):
+    """A path-finder that keeps its distance fields alive between turns
+
+    It holds one distance field per edge. Each time it is used with a new board, the structures
+    that were added or removed since the last board it saw are diffed, and only the parts of each
+    field that those changes affect are repaired. When too many cells changed, the fields are
+    rebuilt from scratch instead.
+
+    An instance lives on your AlgoCore subclass (see AlgoCore.path_finder) and is handed to each
+    turn's GameState, which then uses it for find_path_to_edge and find_paths_to_edge.
+
+    Attributes :
+        * rebuild_threshold (int): The number of changed cells above which the fields are rebuilt instead of repaired
+        * fields (dict): Maps each edge (game_map.TOP_RIGHT, ...) to its distance field, indexed by cell id.
+          Cells that are blocked or cannot reach the edge hold -1
+        * rebuilds (int): The number of times the fields were rebuilt from scratch
+        * repairs (int): The number of times the fields were repaired in place
+
+    """
+    def __init__(self, rebuild_threshold=32):
+        super().__init__()
+        self.rebuild_threshold = rebuild_threshold
+        self.fields = {}
+        self.rebuilds = 0
+        self.repairs = 0
+        self._edge_cells = {}
+        self._edge_masks = {}
+        self._edge_lookup = {}
+        self._synced_state = None
+        self._synced_version = None
+        self._scratch = ShortestPathFinder()
+        self._repath_fields = {}
+
+    def update(self, game_state):
+        """Brings the distance fields up to date with the structures in game_state
+
+        Args:
+            game_state: The GameState the next path queries will be made against
+
+        """
+        board_version = game_state.game_map.board_version
+        if game_state is self._synced_state and board_version == self._synced_version:
+            return
+
+        previous = bytes(self.blocked)
+        self._repath_fields = {}
+        self.initialize_map(game_state)
+        if not self.fields:
+            self._set_edges(game_state.game_map.get_edges())
+            self._rebuild()
+        elif previous != self.blocked:
+            blocked = self.blocked
+            changed = [cell for cell in range(NUM_CELLS) if previous[cell] != blocked[cell]]
+            if len(changed) > self.rebuild_threshold:
+                self._rebuild()
+            else:
+                added = [cell for cell in changed if blocked[cell]]
+                removed = [cell for cell in changed if not blocked[cell]]
+                for edge, field in self.fields.items():
+                    self._repair(field, self._edge_masks[edge], added, removed)
+                self.repairs += 1
+
+        self._synced_state = game_state
+        self._synced_version = board_version
+
+    def navigate_multiple_endpoints(self, start_point, end_points, game_state, extra_blocked=None, extra_open=None):
+        """Finds the path a unit would take to reach a set of endpoints, using the stored field when end_points is an edge
+
+        See ShortestPathFinder.navigate_multiple_endpoints for arguments and return value.
+
+        """
+        start = cell_id(start_point)
+        if start == -1:
+            return
+
+        self.update(game_state)
+        edge = self._edge_lookup.get(tuple(map(cell_id, end_points)))
+        if edge is None:
+            return self._scratch.navigate_multiple_endpoints(start_point, end_points, game_state, extra_blocked, extra_open)
+        return self.paths_from_all([start_point], edge, game_state, extra_blocked, extra_open)[0]
+
+    def paths_from_all(self, start_points, target_edge, game_state, extra_blocked=None, extra_open=None):
+        """Finds the paths units at many start points would take, using the stored fields
+
+        Hypothetical structures in extra_blocked and extra_open are applied to copies of the
+        stored fields with the same local repair used between turns, so scoring a candidate
+        wall placement only costs the repair of the region it affects.
+
+        See ShortestPathFinder.paths_from_all for arguments and return value.
+
+        """
+        self.update(game_state)
+        added, removed = self._apply_overlay(extra_blocked, extra_open)
+        try:
+            fields = self.fields
+            if added or removed:
+                fields = {}
+            edges = game_state.game_map.get_edges()
+            paths = [None] * len(start_points)
+            fallback = []
+            for index, start_point in enumerate(start_points):
+                start = cell_id(start_point)
+                if start == -1 or self.blocked[start]:
+                    continue
+                edge = game_state.get_target_edge(start_point) if target_edge is None else target_edge
+                field = fields.get(edge)
+                if field is None:
+                    field = array('h', self.fields[edge])
+                    self._repair(field, self._edge_masks[edge], added, removed)
+                    fields[edge] = field
+                if field[start] == -1:
+                    fallback.append(index)
+                    continue
+                direction = self._get_direction_from_endpoints(edges[edge])
+                paths[index] = self._get_path(start_point, direction, field)
+        finally:
+            self._remove_overlay(added, removed)
+
+        if fallback:
+            # These starts' pockets cannot reach the edge, so they need the idealness search
+            found = self._scratch.paths_from_all([start_points[index] for index in fallback], target_edge, game_state, extra_blocked, extra_open)
+            for index, path in zip(fallback, found):
+                paths[index] = path
+        return paths
+
+    def repath(self, location, target_edge, game_state, previous_move_direction=0, removed=None):
+        """Finds the rest of a unit's path after structures were destroyed during the action phase
+
+        The stored field of target_edge is repaired around the removed structures instead of
+        being recomputed. The repaired field is kept, so calling this every frame with a growing
+        list of destroyed structures, for one unit or a whole wave, only repairs the new removals.
+
+        Args:
+            * location: The unit's current location
+            * target_edge: The edge the unit is heading for, game_map.TOP_RIGHT etc.
+            * game_state: The GameState of the turn, as it was before the action phase
+            * previous_move_direction: The axis of the unit's last move, self.HORIZONTAL or self.VERTICAL. 0 if it has not moved yet
+            * removed: The locations of structures destroyed since the start of the action phase
+
+        Returns:
+            The path the unit would now take, starting at location. None if location is blocked or outside the arena
+
+        """
+        start = cell_id(location)
+        if start == -1:
+            return
+
+        self.update(game_state)
+        direction = self._get_direction_from_endpoints(game_state.game_map.get_edge_locations(target_edge))
+        added, opened = self._apply_overlay(None, removed)
+        try:
+            if self.blocked[start]:
+                return
+            field = self._repath_field(target_edge, opened)
+            if field[start] != -1:
+                return self._get_path(location, direction, field, previous_move_direction)
+        finally:
+            self._remove_overlay(added, opened)
+
+        # The unit's pocket still cannot reach the edge, so it heads for its self destruct location
+        scratch = self._scratch
+        end_cells = self._edge_cells[target_edge]
+        scratch.initialize_map(game_state, None, removed)
+        scratch._validate(scratch._idealness_search(start, end_cells, direction), end_cells)
+        return scratch._get_path(location, direction, scratch.pathlength, previous_move_direction)
+
+    def _repath_field(self, edge, opened):
+        """Gets the field of an edge repaired for the opened cells, reusing the last repair when it
+        covered a subset of them. self.blocked must already have the opened cells cleared.
+        """
+        opened_set = frozenset(opened)
+        cached = self._repath_fields.get(edge)
+        if cached is not None and cached[0] <= opened_set:
+            field = cached[1]
+            new_cells = [cell for cell in opened if cell not in cached[0]]
+        else:
+            field = array('h', self.fields[edge])
+            new_cells = opened
+        if new_cells:
+            self._repair(field, self._edge_masks[edge], [], new_cells)
+        self._repath_fields[edge] = (opened_set, field)
+        return field
+
+    def _apply_overlay(self, extra_blocked, extra_open):
+        """Applies hypothetical structures to self.blocked and returns the cells that changed as (added, removed)
+        """
+        blocked = self.blocked
+        blocked_cells = set(overlay_cells(extra_blocked))
+        added = [cell for cell in blocked_cells if not blocked[cell]]
+        removed = [cell for cell in set(overlay_cells(extra_open)) if blocked[cell] and cell not in blocked_cells]
+        for cell in added:
+            blocked[cell] = 1
+        for cell in removed:
+            blocked[cell] = 0
+        return added, removed
+
+    def _remove_overlay(self, added, removed):
+        blocked = self.blocked
+        for cell in added:
+            blocked[cell] = 0
+        for cell in removed:
+            blocked[cell] = 1
+
+    def _set_edges(self, edges):
+        for edge, locations in enumerate(edges):
+            end_cells = [cell_id(location) for location in locations]
+            end_mask = bytearray(NUM_CELLS)
+            for cell in end_cells:
+                end_mask[cell] = 1
+            self._edge_cells[edge] = end_cells
+            self._edge_masks[edge] = end_mask
+            self._edge_lookup[tuple(end_cells)] = edge
+
+    def _rebuild(self):
+        """Recomputes every distance field from scratch
+        """
+        for edge, end_cells in self._edge_cells.items():
+            self._validate(end_cells[0], end_cells)
+            self.fields[edge] = array('h', self.pathlength)
+        self.rebuilds += 1
+
+    def _repair(self, field, end_mask, added, removed):
+        """Repairs a distance field in place after structures were added at the cells in added
+        and removed from the cells in removed. self.blocked must already hold the new board.
+
+        Returns:
+            The cells whose distance had to be recomputed because of the added structures
+
+        """
+        blocked = self.blocked
+
+        # Find every cell that lost all of its neighbors one step closer to the edge.
+        # Cells are processed in order of distance so a cell's parents are settled before it is checked.
+        heap = []
+        for cell in added:
+            length = field[cell]
+            field[cell] = -1
+            if length == -1:
+                continue
+            for neighbor in NEIGHBORS[cell]:
+                if field[neighbor] == length + 1:
+                    heapq.heappush(heap, (length + 1, neighbor))
+
+        invalid = bytearray(NUM_CELLS)
+        invalidated = []
+        while heap:
+            length, cell = heapq.heappop(heap)
+            if invalid[cell] or blocked[cell]:
+                continue
+            supported = False
+            for neighbor in NEIGHBORS[cell]:
+                if field[neighbor] == length - 1 and not invalid[neighbor] and not blocked[neighbor]:
+                    supported = True
+                    break
+            if supported:
+                continue
+            invalid[cell] = 1
+            invalidated.append(cell)
+            for neighbor in NEIGHBORS[cell]:
+                if field[neighbor] == length + 1 and not invalid[neighbor]:
+                    heapq.heappush(heap, (length + 1, neighbor))
+
+        # Give invalidated and newly opened cells their best distance from settled neighbors,
+        # then let any improvement spread outwards
+        for cell in invalidated:
+            field[cell] = -1
+        for cell in invalidated + removed:
+            best = 0 if end_mask[cell] else -1
+            for neighbor in NEIGHBORS[cell]:
+                length = field[neighbor]
+                if length != -1 and not blocked[neighbor] and (best == -1 or length + 1 < best):
+                    best = length + 1
+            field[cell] = best
+            if best != -1:
+                heapq.heappush(heap, (best, cell))
+
+        while heap:
+            length, cell = heapq.heappop(heap)
+            if length != field[cell]:
+                continue
+            for neighbor in NEIGHBORS[cell]:
+                if blocked[neighbor]:
+                    continue
+                if field[neighbor] == -1 or field[neighbor] > length + 1:
+                    field[neighbor] = length + 1
+                    heapq.heappush(heap, (length + 1, neighbor))
+        return invalidated
@@ -0,0 +1,664 @@
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .unit import GameUnit
+from .game_state import is_stationary
+from .navigation import ARENA_SIZE
+from .pathing import IncrementalPathFinder
+from .targeting import _bits
+from .threat import support_shield
+
+"""
+The outcome of simulate().
+
+    * my_health (float): Your health after the action phase
+    * enemy_health (float): Your opponent's health after the action phase
+    * breaches (list): An (x, y, player_index) tuple for every unit that scored, player_index being the unit's owner
+    * destroyed (list): An (x, y, unit_type, player_index) tuple for every structure destroyed, in the order they fell
+    * structure_damage (tuple): The damage dealt to each player's structures, indexed by the structures' owner
+    * frames (int): The number of frames until the last mobile unit was gone
+"""
+SimulationResult = namedtuple("SimulationResult", ["my_health", "enemy_health", "breaches", "destroyed", "structure_damage", "frames"])
+
+"""
+The outcome of simulate_batch(), one row per scenario. Every field is a NumPy array.
+
+    * my_health (array): Your health after each scenario's action phase
+    * enemy_health (array): Your opponent's health after each scenario's action phase
+    * breaches (array): Shape (scenarios, 2), the number of units of each player that scored
+    * destroyed (array): Shape (scenarios, 2), the number of structures destroyed, indexed by their owner
+    * structure_damage (array): Shape (scenarios, 2), the damage dealt to structures, indexed by their owner
+    * cost (array): Shape (scenarios, 2), the SP and MP each scenario's spawns cost
+    * frames (array): The number of frames until the last mobile unit of each scenario was gone
+"""
+BatchResult = namedtuple("BatchResult", ["my_health", "enemy_health", "breaches", "destroyed", "structure_damage", "cost", "frames"])
+
+
+def simulate(game_state, deploys=None, enemy_deploys=None, path_finder=None, max_frames=1000):
+    """Predicts the action phase that follows the current turn, frame by frame
+
+    The mobile units already on game_state's map, which includes everything spawned with attempt_spawn,
+    are simulated together with the extra deploys. The game state itself is not changed.
+
+    Every frame follows the engine's order:
+        1. Supports shield the friendly mobile units in their shieldRange, each unit once per support
+        2. Mobile units due to move take one step along their path. A unit that steps onto its target edge
+           breaches, and one that has nowhere left to go self destructs, damaging nearby enemies if it
+           moved at least selfDestructStepsRequired times
+        3. Every unit attacks the target get_target would choose, all at the same time
+        4. Units with no health left are removed. If structures were destroyed, every unit re-paths
+
+    Args:
+        game_state: The GameState to simulate, with your structures and mobile units already placed
+        deploys: Extra mobile units for you, a list of (unit_type, x, y) like a deploy command
+        enemy_deploys: The mobile units you expect your opponent to deploy, a list of (unit_type, x, y)
+        path_finder: The IncrementalPathFinder used to re-path units. Pass a long lived one, like
+            AlgoCore.path_finder, to reuse its distance fields. A new one is created if None
+        max_frames: The number of frames after which the simulation stops, even if units are left
+
+    Returns:
+        A SimulationResult
+
+    """
+    return _Simulation(game_state, deploys, enemy_deploys, path_finder).run(max_frames)
+
+
+def simulate_batch(game_state, scenarios, enemy_deploys=None, path_finder=None, max_frames=1000):
+    """Predicts the action phase of many candidate attacks at once, with the same rules as simulate
+
+    Every scenario starts from game_state and spawns its own units on a fork of it, so each one is
+    checked and paid for like attempt_spawn would. Structures in a scenario, such as supports, are built
+    before the action phase. The scenarios then advance together, one frame at a time, as NumPy arrays of
+    unit positions and health with one row per scenario, and finished scenarios are dropped from the arrays.
+
+    Args:
+        game_state: The GameState every scenario starts from, it is not changed
+        scenarios: A list of scenarios, each a list of (unit_type, x, y) spawns for you
+        enemy_deploys: The mobile units you expect your opponent to deploy in every scenario, a list of (unit_type, x, y)
+        path_finder: The IncrementalPathFinder used to re-path units, see simulate
+        max_frames: The number of frames after which a scenario stops, even if units are left
+
+    Returns:
+        A BatchResult with one row per scenario, in the order of scenarios
+
+    """
+    if np is None:
+        raise ImportError("Batch simulation requires numpy, use simulate instead")
+    return _BatchSimulation(game_state, scenarios, enemy_deploys, path_finder).run(max_frames)
+
+
+def _mobile_rules(config):
+    """(breach damage, self destruct steps, range, damage to mobile units, damage to structures) of each mobile type
+    """
+    rules = {}
+    for type_config in config["unitInformation"]:
+        if type_config.get("unitCategory") == 1:
+            rules[type_config["shorthand"]] = (
+                type_config.get("playerBreachDamage", 1), type_config.get("selfDestructStepsRequired", 5),
+                type_config.get("selfDestructRange", 1.5), type_config.get("selfDestructDamageWalker", 0),
+                type_config.get("selfDestructDamageTower", 0))
+    return rules
+
+
+class _Mover:
+    """A mobile unit and its progress along its path
+    """
+    __slots__ = ("unit", "location", "edge", "edge_locations", "frames_per_move", "path", "step", "moves", "move_direction", "shielded", "rules")
+
+    def __init__(self, unit, edge, edge_locations, rules):
+        self.unit = unit
+        self.location = (unit.x, unit.y)
+        self.edge = edge
+        self.edge_locations = edge_locations
+        self.frames_per_move = max(1, round(1 / unit.speed))
+        self.path = None
+        self.step = 0
+        self.moves = 0
+        self.move_direction = 0
+        self.shielded = set()
+        self.rules = rules
+
+
+class _Simulation:
+    def __init__(self, game_state, deploys, enemy_deploys, path_finder):
+        self.game_state = game_state
+        self.game_map = game_map = game_state.game_map
+        if path_finder is None:
+            path_finder = game_state._shortest_path_finder
+            if not isinstance(path_finder, IncrementalPathFinder):
+                path_finder = IncrementalPathFinder()
+        self.path_finder = path_finder
+        self.health = [game_state.my_health, game_state.enemy_health]
+        self.breaches = []
+        self.destroyed = []
+        self.structure_damage = [0, 0]
+        self.removed = []
+        self.paths = {}
+        self.get_hit_radius = game_state.config["unitInformation"][0]["getHitRadius"]
+
+        self.rules = _mobile_rules(game_state.config)
+
+        # Structures are copied so damage does not reach the game state. coverage maps each location to the
+        # structures that can attack it, shields to the supports that can shield it
+        self.structures = {}
+        self.coverage = {}
+        self.shields = {}
+        self.always_attacking = []
+        for location in game_map.structure_locations():
+            unit = game_map.structure_at(location).copy()
+            self.structures[location] = unit
+            if unit.damage_f > 0:
+                self.always_attacking.append(location)
+            elif unit.damage_i > 0:
+                for covered in game_map.locations_in_range(location, unit.attackRange):
+                    self.coverage.setdefault(covered, []).append(location)
+            amount = support_shield(unit)
+            if amount > 0 and unit.shieldRange > 0:
+                limit = unit.shieldRange * unit.shieldRange
+                for x, y in game_map.locations_in_range(location, unit.shieldRange):
+                    if (x - location[0]) ** 2 + (y - location[1]) ** 2 <= limit:
+                        self.shields.setdefault((x, y), []).append((location, amount))
+
+        self.edges = [set(map(tuple, edge)) for edge in game_map.get_edges()]
+        self.movers = []
+        self.cells = {}
+        for location in self.game_map:
+            if game_map.mobile_unit_count(location):
+                for unit in game_map[location]:
+                    if not unit.stationary:
+                        self.__spawn(unit.copy())
+        for player_index, extra in ((0, deploys), (1, enemy_deploys)):
+            for unit_type, x, y in extra or []:
+                if game_map.in_arena_bounds([x, y]) and (x, y) not in self.structures:
+                    self.__spawn(GameUnit(unit_type, game_state.config, player_index, None, x, y))
+
+    def __spawn(self, unit):
+        edge = self.game_state.get_target_edge([unit.x, unit.y])
+        mover = _Mover(unit, edge, self.edges[edge], self.rules[unit.unit_type])
+        mover.path = self.__path(mover)
+        self.movers.append(mover)
+        self.cells.setdefault(mover.location, []).append(mover)
+
+    def __path(self, mover):
+        key = (mover.location, mover.edge, mover.move_direction)
+        path = self.paths.get(key)
+        if path is None:
+            path = self.path_finder.repath(mover.location, mover.edge, self.game_state, mover.move_direction, self.removed)
+            self.paths[key] = path
+        return path
+
+    def run(self, max_frames):
+        frame = 0
+        while self.movers and frame < max_frames:
+            self.__shield()
+            if frame > 0:
+                self.__move(frame)
+            self.__attack()
+            self.__remove_dead()
+            frame += 1
+        return SimulationResult(self.health[0], self.health[1], self.breaches, self.destroyed, tuple(self.structure_damage), frame)
+
+    def __shield(self):
+        structures = self.structures
+        for mover in self.movers:
+            for location, amount in self.shields.get(mover.location, ()):
+                support = structures.get(location)
+                if support is not None and support.player_index == mover.unit.player_index and location not in mover.shielded:
+                    mover.shielded.add(location)
+                    mover.unit.health += amount
+
+    def __move(self, frame):
+        for mover in list(self.movers):
+            if frame % mover.frames_per_move:
+                continue
+            path = mover.path
+            if path is not None and mover.step + 1 < len(path):
+                x, y = path[mover.step + 1]
+                mover.move_direction = self.path_finder.HORIZONTAL if x != mover.location[0] else self.path_finder.VERTICAL
+                self.__relocate(mover, (x, y))
+                mover.step += 1
+                mover.moves += 1
+                if mover.location in mover.edge_locations:
+                    breach_damage = mover.rules[0]
+                    self.health[1 - mover.unit.player_index] -= breach_damage
+                    self.breaches.append((x, y, mover.unit.player_index))
+                    self.__remove(mover)
+            else:
+                self.__self_destruct(mover)
+
+    def __self_destruct(self, mover):
+        _, steps, radius, damage_walker, damage_tower = mover.rules
+        if mover.moves >= steps:
+            player_index = mover.unit.player_index
+            for location in self.game_map.locations_in_range(mover.location, radius):
+                structure = self.structures.get(location)
+                if structure is not None and structure.player_index != player_index:
+                    self.__damage_structure(structure, damage_tower)
+                for other in self.cells.get(location, ()):
+                    if other.unit.player_index != player_index:
+                        other.unit.health -= damage_walker
+        self.__remove(mover)
+
+    def __attack(self):
+        attackers = set(self.always_attacking)
+        for location, movers in self.cells.items():
+            for structure_location in self.coverage.get(location, ()):
+                if structure_location not in attackers:
+                    structure = self.structures.get(structure_location)
+                    if structure is not None and any(mover.unit.player_index != structure.player_index for mover in movers):
+                        attackers.add(structure_location)
+
+        hits = []
+        for structure_location in attackers:
+            structure = self.structures.get(structure_location)
+            if structure is not None:
+                target = self._target(structure, structure_location)
+                if target is not None:
+                    hits.append((structure, target))
+        for mover in self.movers:
+            target = self._target(mover.unit, mover.location)
+            if target is not None:
+                hits.append((mover.unit, target))
+
+        for attacker, target in hits:
+            if target.stationary:
+                self.__damage_structure(target, attacker.damage_f)
+            else:
+                target.health -= attacker.damage_i
+
+    def _target(self, attacker, attacker_location):
+        """The unit get_target would choose, from the units still in the simulation
+
+        get_target keeps the first of equally good units, scanning locations by x and then y. Adding the
+        location and the unit's place in it to the key lets the occupied locations be checked in any order.
+        """
+        player_index = attacker.player_index
+        ax, ay = attacker_location
+        reach = (attacker.attackRange + self.get_hit_radius) ** 2
+        best = None
+        best_key = None
+        if attacker.damage_i != 0:
+            for (x, y), movers in self.cells.items():
+                distance = (x - ax) ** 2 + (y - ay) ** 2
+                if distance < reach:
+                    for index, mover in enumerate(movers):
+                        unit = mover.unit
+                        if unit.player_index != player_index:
+                            key = (False, distance, unit.health, y if player_index == 0 else -y, -abs(13.5 - x), x, y, index)
+                            if best_key is None or key < best_key:
+                                best = unit
+                                best_key = key
+        if attacker.damage_f != 0:
+            for location in self.game_map.locations_in_range(attacker_location, attacker.attackRange):
+                unit = self.structures.get(location)
+                if unit is not None and unit.player_index != player_index:
+                    x, y = location
+                    key = (True, (x - ax) ** 2 + (y - ay) ** 2, unit.health, y if player_index == 0 else -y, -abs(13.5 - x), x, y, 0)
+                    if best_key is None or key < best_key:
+                        best = unit
+                        best_key = key
+        return best
+
+    def __damage_structure(self, structure, damage):
+        if structure.health > 0:
+            self.structure_damage[structure.player_index] += min(damage, structure.health)
+        structure.health -= damage
+
+    def __remove_dead(self):
+        for mover in list(self.movers):
+            if mover.unit.health <= 0:
+                self.__remove(mover)
+        fallen = [location for location, structure in self.structures.items() if structure.health <= 0]
+        if fallen:
+            for location in fallen:
+                structure = self.structures.pop(location)
+                self.destroyed.append((location[0], location[1], structure.unit_type, structure.player_index))
+                self.removed.append(location)
+            self.paths = {}
+            for mover in self.movers:
+                mover.path = self.__path(mover)
+                mover.step = 0
+
+    def __relocate(self, mover, location):
+        cell = self.cells[mover.location]
+        cell.remove(mover)
+        if not cell:
+            del self.cells[mover.location]
+        mover.location = location
+        self.cells.setdefault(location, []).append(mover)
+
+    def __remove(self, mover):
+        self.movers.remove(mover)
+        cell = self.cells[mover.location]
+        cell.remove(mover)
+        if not cell:
+            del self.cells[mover.location]
+
+
+class _BatchSimulation:
+    """The state of every scenario of simulate_batch, as arrays with one row per scenario still running
+
+    Mobile units have shape (rows, movers) and structures (rows, structures). Scenarios with fewer units
+    than the widest one have their extra slots marked dead.
+    """
+    _row_arrays = ("scenario", "group", "health", "breaches", "destroyed", "structure_damage",
+                   "s_x", "s_y", "s_player", "s_damage_f", "s_damage_i", "s_reach", "s_shield", "s_shield_limit", "s_health", "s_alive",
+                   "m_x", "m_y", "m_player", "m_health", "m_alive", "m_frames_per_move", "m_damage_f", "m_damage_i", "m_reach",
+                   "m_breach", "m_steps", "m_blast_reach", "m_blast_walker", "m_blast_tower", "m_edge", "m_step", "m_moves",
+                   "m_direction", "m_arrival", "m_shielded", "path_x", "path_y", "path_len")
+
+    def __init__(self, game_state, scenarios, enemy_deploys, path_finder):
+        if path_finder is None:
+            path_finder = game_state._shortest_path_finder
+            if not isinstance(path_finder, IncrementalPathFinder):
+                path_finder = IncrementalPathFinder()
+        self.path_finder = path_finder
+        config = game_state.config
+        self.get_hit_radius = config["unitInformation"][0]["getHitRadius"]
+        self.rules = _mobile_rules(config)
+        self.paths = {}
+        game_map = game_state.game_map
+        num_scenarios = len(scenarios)
+
+        # Each scenario is spawned on its own fork. Scenarios that built the same structures share a fork for pathing
+        self.states = []
+        groups = {}
+        group = np.zeros(num_scenarios, dtype=np.intp)
+        built = []
+        deployed = []
+        self.cost = np.zeros((num_scenarios, 2))
+        for index, scenario in enumerate(scenarios):
+            fork = game_state.fork()
+            before = fork.get_resources(0)
+            built.append([])
+            deployed.append([])
+            for unit_type, x, y in scenario:
+                if fork.attempt_spawn(unit_type, [x, y]):
+                    (built if is_stationary(unit_type) else deployed)[-1].append((unit_type, x, y))
+            self.cost[index] = np.subtract(before, fork.get_resources(0))
+            key = tuple(built[-1])
+            if key not in groups:
+                groups[key] = len(self.states)
+                self.states.append(fork)
+            group[index] = groups[key]
+
+        base_structures = [game_map.structure_at(location) for location in game_map.structure_locations()]
+        base_movers = [unit for location in game_map if game_map.mobile_unit_count(location)
+                       for unit in game_map[location] if not unit.stationary]
+        num_structures = len(base_structures) + max(map(len, built), default=0)
+        num_movers = len(base_movers) + max(map(len, deployed), default=0) + len(enemy_deploys or [])
+        shape = (num_scenarios, num_structures)
+        self.scenario = np.arange(num_scenarios)
+        self.group = group
+        self.health = np.tile(np.array([game_state.my_health, game_state.enemy_health], dtype=float), (num_scenarios, 1))
+        self.breaches = np.zeros((num_scenarios, 2), dtype=np.int64)
+        self.destroyed = np.zeros((num_scenarios, 2), dtype=np.int64)
+        self.structure_damage = np.zeros((num_scenarios, 2))
+
+        self.s_x, self.s_y, self.s_player = (np.zeros(shape, dtype=np.int64) for _ in range(3))
+        self.s_damage_f, self.s_damage_i, self.s_reach, self.s_shield, self.s_shield_limit, self.s_health = (np.zeros(shape) for _ in range(6))
+        self.s_alive = np.zeros(shape, dtype=bool)
+        for slot, unit in enumerate(base_structures):
+            self.__set_structure(slice(None), slot, unit)
+        for row in range(num_scenarios):
+            state_map = self.states[group[row]].game_map
+            for slot, (_, x, y) in enumerate(built[row], len(base_structures)):
+                self.__set_structure(row, slot, state_map.structure_at((x, y)))
+
+        shape = (num_scenarios, num_movers)
+        self.m_x, self.m_y, self.m_player, self.m_edge, self.m_step, self.m_moves, self.m_direction, self.m_arrival, self.m_frames_per_move, self.m_steps = (
+            np.zeros(shape, dtype=np.int64) for _ in range(10))
+        (self.m_health, self.m_damage_f, self.m_damage_i, self.m_reach, self.m_breach,
+         self.m_blast_reach, self.m_blast_walker, self.m_blast_tower) = (np.zeros(shape) for _ in range(8))
+        self.m_frames_per_move[:] = 1
+        self.m_alive = np.zeros(shape, dtype=bool)
+        self.m_shielded = np.zeros(shape + (num_structures,), dtype=bool)
+        self.path_x, self.path_y = (np.zeros(shape + (1,), dtype=np.int64) for _ in range(2))
+        self.path_len = np.zeros(shape, dtype=np.int64)
+
+        self.removed = [[] for _ in range(num_scenarios)]
+        templates = {}
+        def template(unit_type, player_index):
+            unit = templates.get((unit_type, player_index))
+            if unit is None:
+                unit = templates[unit_type, player_index] = GameUnit(unit_type, config, player_index, None, 0, 0)
+            return unit
+        for row in range(num_scenarios):
+            state = self.states[group[row]]
+            movers = [(unit, unit.x, unit.y) for unit in base_movers]
+            movers += [(template(unit_type, 0), x, y) for unit_type, x, y in deployed[row]]
+            movers += [(template(unit_type, 1), x, y) for unit_type, x, y in enemy_deploys or []
+                       if state.game_map.in_arena_bounds([x, y]) and not state.contains_stationary_unit([x, y])]
+            for slot, (unit, x, y) in enumerate(movers):
+                self.__set_mover(row, slot, unit, x, y, state)
+        self.m_arrival[:] = np.arange(num_movers)
+        # The columns of the attackers in __attack, structures then mobile units, that can ever hit each kind of unit
+        damage_f = np.concatenate((self.s_damage_f, self.m_damage_f), axis=1)
+        damage_i = np.concatenate((self.s_damage_i, self.m_damage_i), axis=1)
+        self.hits_movers = np.flatnonzero((damage_i != 0).any(axis=0))
+        self.hits_structures = np.flatnonzero((damage_f != 0).any(axis=0))
+        self.shield_slots = np.flatnonzero((self.s_shield > 0).any(axis=0))
+
+        self.edge_masks = np.zeros((4, ARENA_SIZE, ARENA_SIZE), dtype=bool)
+        for edge, locations in enumerate(game_map.get_edges()):
+            for x, y in locations:
+                self.edge_masks[edge, x, y] = True
+
+        self.results = BatchResult(np.zeros(num_scenarios), np.zeros(num_scenarios), np.zeros((num_scenarios, 2), dtype=np.int64),
+                                   np.zeros((num_scenarios, 2), dtype=np.int64), np.zeros((num_scenarios, 2)), self.cost,
+                                   np.zeros(num_scenarios, dtype=np.int64))
+
+    def __set_structure(self, row, slot, unit):
+        self.s_x[row, slot] = unit.x
+        self.s_y[row, slot] = unit.y
+        self.s_player[row, slot] = unit.player_index
+        self.s_damage_f[row, slot] = unit.damage_f
+        self.s_damage_i[row, slot] = unit.damage_i
+        self.s_reach[row, slot] = (unit.attackRange + self.get_hit_radius) ** 2
+        amount = support_shield(unit)
+        if amount > 0 and unit.shieldRange > 0:
+            self.s_shield[row, slot] = amount
+            self.s_shield_limit[row, slot] = unit.shieldRange * unit.shieldRange
+        else:
+            self.s_shield_limit[row, slot] = -1
+        self.s_health[row, slot] = unit.health
+        self.s_alive[row, slot] = True
+
+    def __set_mover(self, row, slot, unit, x, y, state):
+        breach, steps, blast_range, blast_walker, blast_tower = self.rules[unit.unit_type]
+        self.m_x[row, slot] = x
+        self.m_y[row, slot] = y
+        self.m_player[row, slot] = unit.player_index
+        self.m_health[row, slot] = unit.health
+        self.m_alive[row, slot] = True
+        self.m_frames_per_move[row, slot] = max(1, round(1 / unit.speed))
+        self.m_damage_f[row, slot] = unit.damage_f
+        self.m_damage_i[row, slot] = unit.damage_i
+        self.m_reach[row, slot] = (unit.attackRange + self.get_hit_radius) ** 2
+        self.m_breach[row, slot] = breach
+        self.m_steps[row, slot] = steps
+        self.m_blast_reach[row, slot] = (blast_range + self.get_hit_radius) ** 2
+        self.m_blast_walker[row, slot] = blast_walker
+        self.m_blast_tower[row, slot] = blast_tower
+        self.m_edge[row, slot] = state.get_target_edge([x, y])
+        self.__set_path(row, slot, self.__path(row, (x, y), self.m_edge[row, slot], 0))
+
+    def __path(self, row, location, edge, move_direction):
+        """The path of a unit of a row, shared by every row with the same structures built and destroyed
+        """
+        removed = self.removed[row]
+        key = (self.group[row], frozenset(removed), location, edge, move_direction)
+        path = self.paths.get(key)
+        if path is None:
+            found = self.path_finder.repath(location, int(edge), self.states[self.group[row]], move_direction, removed)
+            path = self.paths[key] = np.array(found or [], dtype=np.int64).reshape(-1, 2)
+        return path
+
+    def __set_path(self, row, slot, path):
+        length = len(path)
+        if length > self.path_x.shape[2]:
+            padding = ((0, 0), (0, 0), (0, length - self.path_x.shape[2]))
+            self.path_x = np.pad(self.path_x, padding)
+            self.path_y = np.pad(self.path_y, padding)
+        self.path_x[row, slot, :length] = path[:, 0]
+        self.path_y[row, slot, :length] = path[:, 1]
+        self.path_len[row, slot] = length
+
+    def run(self, max_frames):
+        frame = 0
+        while len(self.scenario):
+            finished = ~self.m_alive.any(axis=1) if frame < max_frames else np.ones(len(self.scenario), dtype=bool)
+            if finished.any():
+                self.__finish(finished, frame)
+                if not len(self.scenario):
+                    break
+            self.__shield()
+            if frame > 0:
+                self.__move(frame)
+            self.__attack()
+            self.__remove_dead()
+            frame += 1
+        return self.results
+
+    def __finish(self, finished, frame):
+        """Records the results of the finished rows and drops them from every array
+        """
+        scenario = self.scenario[finished]
+        self.results.my_health[scenario] = self.health[finished, 0]
+        self.results.enemy_health[scenario] = self.health[finished, 1]
+        self.results.breaches[scenario] = self.breaches[finished]
+        self.results.destroyed[scenario] = self.destroyed[finished]
+        self.results.structure_damage[scenario] = self.structure_damage[finished]
+        self.results.frames[scenario] = frame
+        keep = ~finished
+        for name in self._row_arrays:
+            setattr(self, name, getattr(self, name)[keep])
+        self.removed = [removed for removed, kept in zip(self.removed, keep) if kept]
+
+    def __distances(self, x, y, other_x, other_y):
+        """Squared distances from every unit of (x, y) to every unit of (other_x, other_y) in the same row
+        """
+        return (x[:, :, None] - other_x[:, None, :]) ** 2 + (y[:, :, None] - other_y[:, None, :]) ** 2
+
+    def __shield(self):
+        in_range = self.__distances(self.m_x, self.m_y, self.s_x, self.s_y) <= self.s_shield_limit[:, None, :]
+        shielded = (in_range & ~self.m_shielded & self.m_alive[:, :, None] & self.s_alive[:, None, :]
+                    & (self.m_player[:, :, None] == self.s_player[:, None, :]))
+        if shielded.any():
+            # One support at a time, in the order simulate adds them, so fractional shields round the same way
+            for slot in self.shield_slots:
+                self.m_health += shielded[:, :, slot] * self.s_shield[:, slot, None]
+            self.m_shielded |= shielded
+
+    def __move(self, frame):
+        due = self.m_alive & (frame % self.m_frames_per_move == 0)
+        moving = due & (self.m_step + 1 < self.path_len)
+        rows, slots = np.nonzero(moving)
+        steps = self.m_step[rows, slots] + 1
+        x = self.path_x[rows, slots, steps]
+        y = self.path_y[rows, slots, steps]
+        self.m_direction[rows, slots] = np.where(x != self.m_x[rows, slots], self.path_finder.HORIZONTAL, self.path_finder.VERTICAL)
+        self.m_x[rows, slots] = x
+        self.m_y[rows, slots] = y
+        self.m_step[rows, slots] = steps
+        self.m_moves[rows, slots] += 1
+        self.m_arrival[rows, slots] = frame * self.m_alive.shape[1] + slots
+
+        breached = moving & self.edge_masks[self.m_edge, self.m_x, self.m_y]
+        destructed = due & ~moving
+        self.m_alive &= ~(breached | destructed)
+        for player_index in (0, 1):
+            scored = breached & (self.m_player == player_index)
+            self.breaches[:, player_index] += scored.sum(axis=1)
+            self.health[:, 1 - player_index] -= (scored * self.m_breach).sum(axis=1)
+
+        blasts = destructed & (self.m_moves >= self.m_steps)
+        if blasts.any():
+            enemies = self.m_player[:, :, None] != self.s_player[:, None, :]
+            hit = (blasts[:, :, None] & enemies & self.s_alive[:, None, :]
+                   & (self.__distances(self.m_x, self.m_y, self.s_x, self.s_y) < self.m_blast_reach[:, :, None]))
+            self.__damage_structures((hit * self.m_blast_tower[:, :, None]).sum(axis=1))
+            enemies = self.m_player[:, :, None] != self.m_player[:, None, :]
+            hit = (blasts[:, :, None] & enemies & self.m_alive[:, None, :]
+                   & (self.__distances(self.m_x, self.m_y, self.m_x, self.m_y) < self.m_blast_reach[:, :, None]))
+            self.m_health -= (hit * self.m_blast_walker[:, :, None]).sum(axis=1)
+
+    def __attack(self):
+        # Every structure and mobile unit attacks, see select_targets for how the priorities are packed
+        attacker_x = np.concatenate((self.s_x, self.m_x), axis=1)
+        attacker_y = np.concatenate((self.s_y, self.m_y), axis=1)
+        attacker_player = np.concatenate((self.s_player, self.m_player), axis=1)
+        attacker_reach = np.concatenate((self.s_reach, self.m_reach), axis=1)
+        attacker_alive = np.concatenate((self.s_alive, self.m_alive), axis=1)
+        damage_f = np.concatenate((self.s_damage_f, self.m_damage_f), axis=1)
+        damage_i = np.concatenate((self.s_damage_i, self.m_damage_i), axis=1)
+
+        health_values = np.unique(np.concatenate((self.m_health[self.m_alive], self.s_health[self.s_alive])))
+        num_rows, num_movers = self.m_x.shape
+        num_structures = self.s_x.shape[1]
+        # Mobile units on the same location are ranked like get_target sees them, in the order they arrived
+        order = np.lexsort((self.m_arrival.ravel(), self.m_y.ravel(), self.m_x.ravel(), np.repeat(np.arange(num_rows), num_movers)))
+        ranks = np.empty(order.size, dtype=np.int64)
+        ranks[order] = np.arange(order.size)
+        mover_ties = ranks.reshape(num_rows, num_movers) - np.arange(num_rows)[:, None] * num_movers
+        structure_ties = self.s_x * ARENA_SIZE + self.s_y
+        tie_bits = max(_bits(num_movers), _bits(ARENA_SIZE * ARENA_SIZE))
+        distance_shift = tie_bits + 9 + _bits(len(health_values))
+
+        def best(columns, damage, ties, x, y, player, health, alive):
+            """The target of each attacker in columns among one kind of unit, and whether it has one"""
+            attacking_player = attacker_player[:, columns]
+            center_key = (ARENA_SIZE // 2 - 0.5 - np.abs(ARENA_SIZE // 2 - 0.5 - x)).astype(np.int64)
+            # From least to most significant: ties, center_key, y_key, the health rank and the distance
+            base = ties | (center_key << tie_bits) | (np.searchsorted(health_values, health) << (tie_bits + 9))
+            base_0 = base | (y << (tie_bits + 4))
+            base_1 = base | ((ARENA_SIZE - 1 - y) << (tie_bits + 4))
+            distance = self.__distances(attacker_x[:, columns], attacker_y[:, columns], x, y)
+            eligible = ((attacker_alive[:, columns] & (damage[:, columns] != 0))[:, :, None] & alive[:, None, :]
+                        & (player[:, None, :] != attacking_player[:, :, None]) & (distance < attacker_reach[:, columns, None]))
+            priority = np.where(attacking_player[:, :, None] == 0, base_0[:, None, :], base_1[:, None, :])
+            priority |= distance << distance_shift
+            priority[~eligible] = np.iinfo(np.int64).max
+            return np.argmin(priority, axis=2), eligible.any(axis=2)
+
+        rows = np.arange(num_rows)[:, None]
+        has_mover_target = np.zeros(attacker_x.shape, dtype=bool)
+        if num_movers and len(self.hits_movers):
+            columns = self.hits_movers
+            targets, hits = best(columns, damage_i, mover_ties, self.m_x, self.m_y, self.m_player, self.m_health, self.m_alive)
+            has_mover_target[:, columns] = hits
+            damage = np.bincount((rows * num_movers + targets)[hits], damage_i[:, columns][hits], num_rows * num_movers)
+            self.m_health -= damage.reshape(num_rows, num_movers)
+        if num_structures and len(self.hits_structures):
+            # Structures are only targeted by attackers with no mobile unit in range
+            columns = self.hits_structures
+            targets, hits = best(columns, damage_f, structure_ties, self.s_x, self.s_y, self.s_player, self.s_health, self.s_alive)
+            hits &= ~has_mover_target[:, columns]
+            damage = np.bincount((rows * num_structures + targets)[hits], damage_f[:, columns][hits], num_rows * num_structures)
+            self.__damage_structures(damage.reshape(num_rows, num_structures))
+
+    def __damage_structures(self, damage):
+        dealt = np.minimum(damage, np.maximum(self.s_health, 0))
+        for player_index in (0, 1):
+            self.structure_damage[:, player_index] += (dealt * (self.s_player == player_index)).sum(axis=1)
+        self.s_health -= damage
+
+    def __remove_dead(self):
+        self.m_alive &= self.m_health > 0
+        fallen = self.s_alive & (self.s_health <= 0)
+        if not fallen.any():
+            return
+        self.s_alive &= ~fallen
+        for player_index in (0, 1):
+            self.destroyed[:, player_index] += (fallen & (self.s_player == player_index)).sum(axis=1)
+        for row in np.flatnonzero(fallen.any(axis=1)):
+            slots = np.flatnonzero(fallen[row])
+            self.removed[row] = self.removed[row] + list(zip(self.s_x[row, slots].tolist(), self.s_y[row, slots].tolist()))
+            for slot in np.flatnonzero(self.m_alive[row]):
+                location = (int(self.m_x[row, slot]), int(self.m_y[row, slot]))
+                self.__set_path(row, slot, self.__path(row, location, self.m_edge[row, slot], int(self.m_direction[row, slot])))
+                self.m_step[row, slot] = 0
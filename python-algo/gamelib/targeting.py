@@ -0,0 +1,114 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .navigation import ARENA_SIZE
+
+HALF_ARENA = ARENA_SIZE // 2
+
+"""
+Batched targeting picks the target of many attackers at once, with the same rules as GameState.get_target:
+mobile units over structures, then the nearest, the lowest health, the lowest Y position (the highest for
+player 1's attackers) and finally the furthest from the board's center X.
+
+Instead of comparing candidates one at a time, every (attacker, candidate) pair gets one int64 priority with
+those keys packed from most to least significant, and each attacker takes the candidate with the lowest one.
+The last key is the candidate's index, so ties go to the candidate get_target would have seen first, as long
+as the candidates are ordered by x, then y, then their order within a location, like candidate_arrays does.
+"""
+
+
+def _bits(count):
+    return max(1, int(count).bit_length())
+
+
+def select_targets(attacker_x, attacker_y, attacker_player, attacker_range, attacker_damage_f, attacker_damage_i,
+                   target_x, target_y, target_player, target_stationary, target_health, get_hit_radius=0.01):
+    """Picks the target of every attacker, see get_target for the rules
+
+    All arguments are NumPy arrays, or anything np.asarray accepts, with one entry per attacker or per candidate.
+
+    Args:
+        attacker_x, attacker_y: The attackers' locations
+        attacker_player: The attackers' player indices
+        attacker_range: The attackers' attackRange
+        attacker_damage_f, attacker_damage_i: The attackers' damage against structures and against mobile units
+        target_x, target_y: The candidates' locations, ordered as described in the module documentation
+        target_player: The candidates' player indices
+        target_stationary: True for candidates that are structures
+        target_health: The candidates' health
+        get_hit_radius: The config's getHitRadius, which extends every range like in GameMap.locations_in_range
+
+    Returns:
+        An int array with the index of each attacker's target among the candidates, -1 if it has none
+
+    """
+    if np is None:
+        raise ImportError("Batched targeting requires numpy, use GameState.get_target instead")
+    attacker_x = np.asarray(attacker_x, dtype=np.int64)[:, None]
+    attacker_y = np.asarray(attacker_y, dtype=np.int64)[:, None]
+    attacker_player = np.asarray(attacker_player)[:, None]
+    attacker_range = np.asarray(attacker_range, dtype=np.float64)[:, None]
+    attacker_damage_f = np.asarray(attacker_damage_f, dtype=np.float64)[:, None]
+    attacker_damage_i = np.asarray(attacker_damage_i, dtype=np.float64)[:, None]
+    target_x = np.asarray(target_x, dtype=np.int64)
+    target_y = np.asarray(target_y, dtype=np.int64)
+    target_player = np.asarray(target_player)
+    target_stationary = np.asarray(target_stationary, dtype=bool)
+    target_health = np.asarray(target_health, dtype=np.float64)
+    num_targets = len(target_x)
+    if attacker_x.shape[0] == 0 or num_targets == 0:
+        return np.full(attacker_x.shape[0], -1, dtype=np.intp)
+
+    distance_squared = (target_x - attacker_x) ** 2 + (target_y - attacker_y) ** 2
+    eligible = ((target_player != attacker_player)
+                & (distance_squared < (attacker_range + get_hit_radius) ** 2)
+                & np.where(target_stationary, attacker_damage_f != 0, attacker_damage_i != 0))
+
+    # Keys from least to most significant, each a small non-negative int where lower is better
+    _, health_rank = np.unique(target_health, return_inverse=True)
+    y_key = np.where(attacker_player == 0, target_y, ARENA_SIZE - 1 - target_y)
+    center_key = (HALF_ARENA - 0.5 - np.abs(HALF_ARENA - 0.5 - target_x)).astype(np.int64)
+    keys = ((np.arange(num_targets), _bits(num_targets)),
+            (center_key, _bits(HALF_ARENA)),
+            (y_key, _bits(ARENA_SIZE)),
+            (health_rank.reshape(-1), _bits(num_targets)),
+            (distance_squared, _bits(2 * ARENA_SIZE * ARENA_SIZE)),
+            (target_stationary.astype(np.int64), 1))
+    priority = np.zeros(distance_squared.shape, dtype=np.int64)
+    shift = 0
+    for key, bits in keys:
+        priority |= np.asarray(key, dtype=np.int64) << shift
+        shift += bits
+    priority[~eligible] = np.iinfo(np.int64).max
+
+    targets = np.argmin(priority, axis=1)
+    targets[~eligible.any(axis=1)] = -1
+    return targets
+
+
+def candidate_arrays(game_map):
+    """Gathers every unit on a map in the order get_target looks at them
+
+    Args:
+        game_map: A GameMap
+
+    Returns:
+        A tuple (units, x, y, player_index, stationary, health) of the list of GameUnits and the matching
+        arguments of select_targets
+
+    """
+    if np is None:
+        raise ImportError("Batched targeting requires numpy, use GameState.get_target instead")
+    units = []
+    for x in range(ARENA_SIZE):
+        for y in range(ARENA_SIZE):
+            if game_map.in_arena_bounds((x, y)):
+                units.extend(game_map[x, y])
+    return (units,
+            np.array([unit.x for unit in units], dtype=np.int64),
+            np.array([unit.y for unit in units], dtype=np.int64),
+            np.array([unit.player_index for unit in units], dtype=np.int64),
+            np.array([unit.stationary for unit in units], dtype=bool),
+            np.array([unit.health for unit in units], dtype=np.float64))
@@ -1,7 +1,16 @@
 import unittest
 import json
+import random
+import math
 from .game_state import GameState
 from .unit import GameUnit
+from .navigation import ShortestPathFinder, NodePathFinder, cell_id
+from .pathing import IncrementalPathFinder
+from .numpy_navigation import NumpyPathFinder, np
+from .path_analysis import path_sensitivity
+from . import bitboard, unit, util
+from .board_arrays import unit_type_indices, empty_board_arrays, write_location
+from .simulator import simulate, simulate_batch, _Simulation
 
 class BasicTests(unittest.TestCase):
 
@@ -192,6 +201,14 @@ class BasicTests(unittest.TestCase):
         state.suppress_warnings(True)
         return state
 
+    def make_random_map(self, seed, density=0.3):
+        game = self.make_turn_0_map()
+        rng = random.Random(seed)
+        for location in game.game_map:
+            if rng.random() < density:
+                game.game_map.add_unit("FF", location, 0 if location[1] < game.HALF_ARENA else 1)
+        return game
+
     def test_basic(self):
         self.assertEqual(True, True, "It's the end of the world as we know it, and I feel fine")
 
@@ -215,6 +232,422 @@ class BasicTests(unittest.TestCase):
         self.assertEqual([("DF", 13, 6)], game._build_stack, "Build queue is wrong!")
         self.assertEqual([("SI", 13, 0), ("SI", 13, 0), ("SI", 13, 0)], game._deploy_stack, "Deploy queue is wrong!")
 
+    def test_stacked_spawning(self):
+        bulk = self.make_turn_0_map()
+        single = self.make_turn_0_map()
+        warnings = {bulk: [], single: []}
+        for game in warnings:
+            game.warn = warnings[game].append
+        spawned = bulk.attempt_spawn("PI", [[13, 0], [3, 10], [14, 0]], 3)
+        for location in [[13, 0], [3, 10], [14, 0]]:
+            for _ in range(3):
+                single.attempt_spawn("PI", location)
+        self.assertEqual(5, spawned, "Should spawn as many scouts as we can afford")
+        self.assertEqual(single._deploy_stack, bulk._deploy_stack, "Deploy queue should match spawning one at a time")
+        self.assertEqual(single.get_resources(), bulk.get_resources(), "Resources should match spawning one at a time")
+        self.assertEqual(warnings[single], warnings[bulk], "Warnings should match spawning one at a time")
+
+        self.assertEqual(3, bulk.game_map.mobile_unit_count([13, 0]), "Stacked units should be counted")
+        self.assertEqual(2, bulk.game_map.mobile_unit_count([3, 10], "PI", 0), "Stacked units should be counted by type and player")
+        units = bulk.game_map[13, 0]
+        self.assertEqual(3, len(units), "Reading a location should create the stacked units")
+        self.assertEqual(("PI", 0, [13, 0], 15), (units[0].unit_type, units[0].player_index, [units[0].x, units[0].y], units[0].health), "Stacked units have the wrong details")
+        self.assertEqual(3, bulk.game_map.mobile_unit_count([13, 0]), "Creating the units should not change the count")
+
+    def test_fork(self):
+        game = self.make_random_map(11, density=0.2)
+        game.suppress_warnings(True)
+        game.attempt_spawn("PI", [13, 0], 2)
+        path = game.find_path_to_edge([14, 0])
+        fork = game.fork()
+        self.assertEqual(path, fork.find_path_to_edge([14, 0]), "Fork should see the same board")
+
+        fork.attempt_spawn("DF", [[14, 1], [12, 1]])
+        fork.game_map.remove_unit([13, 0])
+        turret = [location for location in fork.game_map.structure_locations(0) if location[1] < 13][0]
+        fork.game_map[turret][0].health = 1
+        fork.attempt_upgrade(list(turret))
+        fork.attempt_spawn("PI", [3, 10])
+        self.assertEqual(path, game.find_path_to_edge([14, 0]), "Changing the fork should not change the original's paths")
+        self.assertFalse(game.contains_stationary_unit([14, 1]), "Structures spawned on the fork should not appear in the original")
+        self.assertEqual(2, len(game.game_map[13, 0]), "Units removed from the fork should stay in the original")
+        self.assertNotEqual(1, game.game_map[turret][0].health, "Unit edits on the fork should not reach the original")
+        self.assertFalse(game.game_map[turret][0].upgraded, "Upgrades on the fork should not reach the original")
+        self.assertEqual([("PI", 13, 0), ("PI", 13, 0)], game._deploy_stack, "The original's deploy queue should not change")
+        self.assertLess(fork.get_resource(game.MP), game.get_resource(game.MP), "Resources should be separate")
+
+        game.game_map.add_unit("FF", [3, 11])
+        game.game_map[turret][0].health = 2
+        self.assertFalse(fork.contains_stationary_unit([3, 11]), "Changes to the original should not reach the fork")
+        self.assertEqual(1, fork.game_map[turret][0].health, "Changes to the original should not reach the fork")
+        self.assertEqual(fork.game_map.structure_locations(0, "DF").count((14, 1)), 1, "The fork's index should be up to date")
+
+        wall = [location for location in game.game_map.structure_locations(1, "FF") if location != turret][0]
+        fork = game.fork()
+        fork.contains_stationary_unit(list(wall)).health = 1
+        fork.game_map.structure_at(wall).pending_removal = True
+        self.assertEqual(75, game.game_map.structure_at(wall).health, "Units looked up on the fork should be the fork's own")
+        self.assertFalse(game.game_map[wall][0].pending_removal)
+        self.assertIs(fork.game_map.structure_at(wall), fork.game_map[wall][0])
+        self.assertEqual(1, fork.game_map[wall][0].health)
+
+    def test_transaction(self):
+        game = self.make_random_map(12, density=0.2)
+        game.suppress_warnings(True)
+        game.attempt_spawn("PI", [13, 0], 2)
+        game.as_arrays()
+        before_units = {(x, y): [(unit.unit_type, unit.player_index, unit.health, unit.upgraded) for unit in game.game_map[x, y]] for x, y in game.game_map}
+        before_arrays = [array.copy() for array in game.as_arrays()]
+        before_resources = game.get_resources(), game.get_resources(1)
+        before_stacks = list(game._build_stack), list(game._deploy_stack)
+        before_structures = sorted(game.game_map.structure_locations())
+        version = game.board_version
+        path = game.find_path_to_edge([14, 0])
+        turret = [location for location in game.game_map.structure_locations(0) if location[1] < 13][0]
+
+        with game.transaction() as tx:
+            game.attempt_spawn("DF", [[14, 1], [12, 1]])
+            game.attempt_spawn("EI", [[12, 1], [20, 6]], 3)
+            game.attempt_upgrade(list(turret))
+            game.attempt_remove(list(turret))
+            game.game_map.remove_unit([13, 0])
+            game.game_map.add_unit("FF", [10, 10], 1)
+            with game.transaction():
+                game.attempt_spawn("FF", [11, 2])
+            self.assertTrue(game.contains_stationary_unit([11, 2]), "A finished nested transaction should keep its changes")
+            self.assertNotEqual(version, game.board_version)
+            tx.rollback()
+            self.assertEqual(path, game.find_path_to_edge([14, 0]), "Paths should match the restored board")
+            with game.transaction() as inner:
+                game.attempt_spawn("FF", [11, 2])
+                inner.rollback()
+                self.assertFalse(game.contains_stationary_unit([11, 2]), "A nested rollback should undo its own changes")
+
+        self.assertEqual(before_units, {(x, y): [(unit.unit_type, unit.player_index, unit.health, unit.upgraded) for unit in game.game_map[x, y]] for x, y in game.game_map})
+        self.assertEqual(before_resources, (game.get_resources(), game.get_resources(1)))
+        self.assertEqual(before_stacks, (game._build_stack, game._deploy_stack))
+        self.assertEqual(version, game.board_version, "Rolling back should restore the board version")
+        self.assertEqual(before_structures, sorted(game.game_map.structure_locations()), "The occupancy index should be restored")
+        if np is not None:
+            for before, after in zip(before_arrays, game.as_arrays()):
+                self.assertTrue(np.array_equal(before, after), "Board arrays should be restored")
+
+        try:
+            with game.transaction():
+                game.attempt_spawn("FF", [11, 2])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(game.contains_stationary_unit([11, 2]), "An exception should roll the transaction back")
+        with game.transaction():
+            game.attempt_spawn("FF", [11, 2])
+        self.assertTrue(game.contains_stationary_unit([11, 2]), "Changes should be kept when the block ends")
+
+        with game.transaction() as tx:
+            game.attempt_spawn("PI", [14, 0], 3)
+            game.game_map[14, 0]
+            fork = game.fork()
+            tx.rollback()
+        self.assertEqual(0, game.game_map.mobile_unit_count([14, 0]))
+        self.assertEqual(3, len(fork.game_map[14, 0]), "Rolling back the original should not change a fork made during the transaction")
+        self.assertEqual(3, fork._deploy_stack.count(("PI", 14, 0)))
+
+    def test_decoded_state(self):
+        game = self.make_random_map(13, density=0.2)
+        units = [[[x, y, 75.0, "1"] for x, y in game.game_map.structure_locations(0)], [], [], [], [], [], []]
+        message = json.dumps({"p2Units": [[], [], [], [], [], [], []], "turnInfo": [0, 3, -1], "p1Stats": [30.0, 25.0, 5.0, 0],
+            "p1Units": units, "p2Stats": [28.0, 12.0, 7.0, 0], "events": {}})
+        from_string = GameState(game.config, message)
+        state = util.decode_json(message)
+        self.assertIsNot(state, util.decode_json(message), "Every decode should give a fresh dict")
+        self.assertEqual(json.loads(message), state)
+        from_dict = GameState(game.config, state)
+        for parsed in (from_string, from_dict):
+            self.assertEqual(3, parsed.turn_number)
+            self.assertEqual(28.0, parsed.enemy_health)
+            self.assertEqual({"SP": 12.0, "MP": 7.0}, parsed._player_resources[1])
+            self.assertEqual(sorted(game.game_map.structure_locations(0)), sorted(parsed.game_map.structure_locations()))
+
+        orjson = util.orjson
+        try:
+            util.orjson = None
+            self.assertEqual(state, util.decode_json(message + " "), "The json fallback should decode the same message")
+        finally:
+            util.orjson = orjson
+
+    def test_starter_strategy_decoded_states(self):
+        from unittest import mock
+        from . import algocore, game_state
+        import algo_strategy
+        game = self.make_turn_0_map()
+        frame = {"p2Units": [[]] * 7, "turnInfo": [1, 0, 5], "p1Stats": [29.0, 25.0, 5.0, 0], "p1Units": [[]] * 7,
+                 "p2Stats": [30.0, 25.0, 5.0, 0], "events": {"breach": [[[3, 10], 1.0, 3, "7", 2], [[24, 17], 1.0, 3, "8", 1]]}}
+        turn = dict(frame, turnInfo=[0, 1, -1], events={})
+        messages = [json.dumps(game.config), json.dumps(turn), json.dumps(frame), json.dumps(dict(frame, turnInfo=[2, 1, -1]))]
+        for decoded_states in (False, True):
+            algo = algo_strategy.AlgoStrategy()
+            algo.decoded_states = decoded_states
+            decode_json = mock.Mock(wraps=util.decode_json)
+            with mock.patch.object(algocore, "get_command", side_effect=list(messages)), \
+                    mock.patch.object(algocore, "decode_json", decode_json), mock.patch.object(game_state, "decode_json", decode_json), \
+                    mock.patch("gamelib.decode_json", decode_json), \
+                    mock.patch.object(game_state, "send_command") as send_command, mock.patch.object(algocore, "debug_write"):
+                algo.start()
+            self.assertEqual([[3, 10]], algo.scored_on_locations, "Only the enemy's breach should be recorded")
+            self.assertEqual(2, send_command.call_count, "The turn should be submitted")
+            self.assertEqual(len(messages), decode_json.call_count, "Each message should only be decoded once")
+
+    def test_lazy_state(self):
+        game = self.make_random_map(14, density=0.2)
+        units = [[[x, y, 75.0, "1"] for x, y in game.game_map.structure_locations(0)], [], [], [[3, 10, 15.0, "2"]], [], [], []]
+        message = json.dumps({"p2Units": [[], [], [], [], [], [], []], "turnInfo": [0, 3, -1], "p1Stats": [30.0, 25.0, 5.0, 0],
+            "p1Units": units, "p2Stats": [28.0, 12.0, 7.0, 0], "events": {}})
+        eager = GameState(game.config, message)
+        lazy = GameState(game.config, message, lazy=True)
+        lazy.suppress_warnings(True)
+        self.assertEqual(3, lazy.turn_number)
+        self.assertEqual(25.0, lazy.get_resource(lazy.SP))
+        self.assertIsNotNone(lazy._pending_units, "Resources should not need the units")
+        self.assertTrue(lazy.contains_stationary_unit(units[0][0][:2]), "Structure lookups should add the units")
+        self.assertIsNone(lazy._pending_units)
+        self.assertEqual(sorted(eager.game_map.structure_locations()), sorted(lazy.game_map.structure_locations()))
+        self.assertEqual(1, len(lazy.game_map[3, 10]))
+
+        lazy = GameState(game.config, message, lazy=True)
+        self.assertEqual(eager.find_path_to_edge([3, 10]), lazy.find_path_to_edge([3, 10]), "Pathing should add the units")
+        lazy = GameState(game.config, message, lazy=True)
+        self.assertEqual(len(units[0]), len(lazy.fork().game_map.structure_locations()), "Forks should see the units")
+
+    def test_threat_field(self):
+        game = self.make_turn_0_map()
+        rng = random.Random(15)
+        for location in game.game_map:
+            if rng.random() < 0.15:
+                game.game_map.add_unit(rng.choice(["FF", "DF", "DF"]), location, 0 if location[1] < game.HALF_ARENA else 1)
+        turrets = list(game.game_map.structure_locations(0, "DF"))
+
+        def check(field, player_index):
+            for location in game.game_map:
+                attackers = [unit for unit in game.get_attackers(location, player_index) if unit.stationary]
+                self.assertEqual(len(attackers), field.count_at(location))
+                self.assertAlmostEqual(sum(unit.damage_i for unit in attackers), field.damage_at(location))
+                self.assertEqual(sorted(id(unit) for unit in attackers), sorted(id(unit) for unit in field.attackers(location)))
+
+        for player_index in (0, 1):
+            check(game.threat_field(player_index), player_index)
+
+        field = game.threat_field(1)
+        self.assertIs(field, game.threat_field(1), "The field should be reused while the board is unchanged")
+        fork = game.fork()
+        game.attempt_upgrade(list(turrets[0]))
+        game.game_map.remove_unit(turrets[1])
+        game.game_map.add_unit("DF", [13, 2])
+        check(game.threat_field(1), 1)
+        fork_damage = [fork.threat_field(1).damage_at(location) for location in fork.game_map]
+        fork_expected = [sum(unit.damage_i for unit in fork.get_attackers(location, 1) if unit.stationary) for location in fork.game_map]
+        self.assertEqual(fork_expected, fork_damage, "A fork's field should not see changes to the original")
+
+        path = game.find_path_to_edge([13, 27])
+        self.assertEqual(sum(game.threat_field(1).damage_at(location) for location in path), game.threat_field(1).exposure(path))
+        self.assertIsNone(game.threat_field(1).exposure(None))
+
+    def test_shield_field(self):
+        config = json.loads(json.dumps(self.make_turn_0_map().config))
+        config["unitInformation"][1].update({"shieldPerUnit": 3.0, "shieldRange": 2.5, "upgrade": {"shieldRange": 6, "shieldPerUnit": 2, "shieldBonusPerY": 0.3}})
+        game = GameState(config, json.dumps({"p2Units": [[]] * 7, "turnInfo": [0, 0, -1], "p1Stats": [30.0, 25.0, 5.0, 0],
+            "p1Units": [[]] * 7, "p2Stats": [30.0, 25.0, 5.0, 0], "events": {}}))
+        game.suppress_warnings(True)
+        game.attempt_spawn("EF", [[13, 2], [10, 5], [20, 8]])
+        game.game_map.add_unit("EF", [14, 20], 1)
+        game.game_map.add_unit("EF", [14, 25], 1)
+        game.game_map[14, 20][0].upgrade()
+        game.game_map.refresh_location([14, 20])
+
+        def amount(unit):
+            rows_forward = unit.y if unit.player_index == 0 else 27 - unit.y
+            return unit.shieldPerUnit + unit.shieldBonusPerY * rows_forward
+
+        def check(player_index):
+            field = game.shield_field(player_index)
+            supports = [game.game_map.structure_at(location) for location in game.game_map.structure_locations(player_index, "EF")]
+            for location in game.game_map:
+                in_range = [unit for unit in supports if game.game_map.distance_between_locations(location, [unit.x, unit.y]) <= unit.shieldRange]
+                self.assertAlmostEqual(sum(amount(unit) for unit in in_range), field.shield_at(location))
+                self.assertEqual(sorted(id(unit) for unit in in_range), sorted(id(unit) for unit in field.supporters(location)))
+            for path in game.find_paths_to_edge([[x, 13 - x] for x in range(14)] + [[x, 41 - x] for x in range(14, 28)]):
+                reached = [unit for unit in supports if any(game.game_map.distance_between_locations(location, [unit.x, unit.y]) <= unit.shieldRange for location in path)]
+                self.assertAlmostEqual(sum(amount(unit) for unit in reached), field.path_shield(path), msg="Each support should count once per path")
+
+        game.shield_field(0)
+        game.attempt_upgrade([10, 5])
+        game.game_map.remove_unit([13, 2])
+        game.attempt_spawn("EF", [12, 3])
+        for player_index in (0, 1):
+            check(player_index)
+        self.assertAlmostEqual(2 + 0.3 * 7, game.shield_field(1).shield_at([14, 20]), msg="Player 1 rows should count from the top edge")
+        self.assertAlmostEqual(0, game.shield_field(0).shield_at([0, 13]))
+        self.assertIsNone(game.shield_field(0).path_shield(None))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_batched_targets(self):
+        for seed in range(5):
+            game = self.make_turn_0_map()
+            rng = random.Random(seed)
+            for location in game.game_map:
+                roll = rng.random()
+                player_index = 0 if location[1] < game.HALF_ARENA else 1
+                if roll < 0.15:
+                    game.game_map.add_unit(rng.choice(["FF", "EF", "DF", "DF"]), location, player_index)
+                elif roll < 0.3:
+                    for _ in range(rng.randint(1, 3)):
+                        game.game_map.add_unit(rng.choice(["PI", "EI", "SI"]), location, rng.randint(0, 1))
+            for location in game.game_map:
+                for unit in game.game_map[location]:
+                    unit.health = rng.choice([5, 10, 15, unit.health])
+                    if unit.unit_type == "DF" and rng.random() < 0.3:
+                        unit.upgrade()
+            attackers = [unit for location in game.game_map for unit in game.game_map[location] if unit.damage_i + unit.damage_f > 0]
+            expected = [game.get_target(unit) for unit in attackers]
+            self.assertGreater(sum(target is not None for target in expected), 20)
+            self.assertEqual([id(target) for target in expected], [id(target) for target in game.get_targets(attackers)])
+        self.assertEqual([], game.get_targets([]))
+
+    def test_simulator(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("PI", [13, 0], 3)
+        path = game.find_path_to_edge([13, 0])
+        result = simulate(game)
+        self.assertEqual([tuple(path[-1]) + (0,)] * 3, result.breaches, "Scouts on an open board should all score at the end of their path")
+        self.assertEqual(27.0, result.enemy_health)
+        self.assertEqual(30.0, result.my_health)
+        self.assertEqual(len(path), result.frames)
+        self.assertEqual(3, game.game_map.mobile_unit_count([13, 0]), "Simulating should not change the game state")
+
+        # A turret next to the end of the path hits each scout on the two locations in its range
+        game.game_map.add_unit("DF", [24, 15], 1)
+        result = simulate(game)
+        self.assertEqual(3, len(result.breaches))
+        self.assertGreater(result.structure_damage[1], 0, "Scouts should shoot the turret while in range")
+        self.assertEqual(0, result.structure_damage[1] % 2)
+        self.assertEqual(90, game.game_map[24, 15][0].health)
+        game.game_map[24, 15][0].upgrade()
+        result = simulate(game)
+        self.assertEqual([], result.breaches, "An upgraded turret should kill every scout")
+        result = simulate(game, enemy_deploys=[("PI", 14, 27)])
+        enemy_path = game.find_path_to_edge([14, 27])
+        self.assertEqual([tuple(enemy_path[-1]) + (1,)], [breach for breach in result.breaches if breach[2] == 1], "Enemy deploys should path to our edge")
+        self.assertEqual(29.0, result.my_health)
+
+        # A wall across the board is shot open, and the scout re-paths through the gap
+        game = self.make_turn_0_map()
+        for x in range(28):
+            game.game_map.add_unit("FF", [x, 14], 1)
+            game.game_map[x, 14][0].health = 1
+        game.attempt_spawn("PI", [13, 0])
+        result = simulate(game)
+        self.assertTrue(result.destroyed)
+        self.assertEqual(len(result.destroyed), result.structure_damage[1])
+        self.assertTrue(all((x, 14, "FF", 1) in [(x, 14, "FF", 1) for x in range(28)] for x, _, _, _ in result.destroyed))
+        self.assertEqual(1, len(result.breaches))
+
+        # With full health walls the scouts are stuck, and self destruct on the walls after enough steps
+        game = self.make_turn_0_map()
+        for x in range(28):
+            game.game_map.add_unit("FF", [x, 14], 1)
+        game.attempt_spawn("PI", [13, 0], 1)
+        stuck = simulate(game)
+        self.assertEqual([], stuck.breaches)
+        self.assertEqual([], stuck.destroyed)
+        self.assertEqual(30.0, stuck.enemy_health)
+        self.assertGreaterEqual(stuck.structure_damage[1], 15, "The self destruct should damage the walls")
+
+        # Supports shield passing units once, which lets scouts survive the upgraded turret
+        config = json.loads(json.dumps(game.config))
+        config["unitInformation"][1].update({"shieldPerUnit": 20.0, "shieldRange": 3.5})
+        game = GameState(config, json.dumps({"p2Units": [[]] * 7, "turnInfo": [0, 0, -1], "p1Stats": [30.0, 25.0, 5.0, 0],
+            "p1Units": [[]] * 7, "p2Stats": [30.0, 25.0, 5.0, 0], "events": {}}))
+        game.suppress_warnings(True)
+        game.game_map.add_unit("DF", [24, 15], 1)
+        game.game_map[24, 15][0].upgrade()
+        game.attempt_spawn("PI", [13, 0])
+        self.assertEqual([], simulate(game).breaches)
+        game.attempt_spawn("EF", [[15, 4], [19, 6], [22, 9], [23, 11]])
+        self.assertEqual(1, len(simulate(game).breaches), "Four supports should add enough shield to survive")
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_simulate_batch(self):
+        # The second config gives supports a fractional shield, so health is only equal if shields are added in the same order
+        for shield in ({}, {"shieldPerUnit": 3.0, "shieldBonusPerY": 0.3, "shieldRange": 14.0}):
+            game = self.make_turn_0_map()
+            if shield:
+                config = json.loads(json.dumps(game.config))
+                config["unitInformation"][1].update(shield)
+                game = GameState(config, json.dumps({"p2Units": [[]] * 7, "turnInfo": [0, 0, -1], "p1Stats": [30.0, 25.0, 5.0, 0],
+                    "p1Units": [[]] * 7, "p2Stats": [30.0, 25.0, 5.0, 0], "events": {}}))
+                game.suppress_warnings(True)
+            rng = random.Random(1)
+            for location in game.game_map:
+                if location[1] >= game.HALF_ARENA and rng.random() < 0.12:
+                    game.game_map.add_unit(rng.choice(["FF", "DF", "DF", "EF"]), location, 1)
+            if shield:
+                # Two hits of this turret take exactly the 15 + 3.6 + 5.1 + 6.3 health the supports below give a scout
+                game.game_map[24, 16] = []
+                game.game_map.add_unit("DF", [24, 16], 1)
+                game.game_map[24, 16][0].upgrade()
+            game.game_map.add_unit("PI", [13, 0], 0)
+            enemy_deploys = [("PI", 14, 27), ("SI", 14, 27)]
+            scenarios = [[]]
+            for x, y in [[13, 0], [3, 10], [20, 6], [27, 13]]:
+                for mix in (["PI"] * 5, ["EI"], ["SI", "PI", "PI"]):
+                    for builds in ([], [("EF", 13, 3)], [("FF", 14, 5), ("EF", 9, 6)], [("EF", 11, 2), ("EF", 7, 7), ("EF", 6, 11)]):
+                        scenarios.append(builds + [(unit_type, x, y) for unit_type in mix])
+            scenarios.append([("PI", 5, 5), ("EI", 13, 0)] * 3)
+
+            results = simulate_batch(game, scenarios, enemy_deploys)
+            self.assertEqual(len(scenarios), len(results.frames))
+            for index, scenario in enumerate(scenarios):
+                fork = game.fork()
+                for unit_type, x, y in scenario:
+                    fork.attempt_spawn(unit_type, [x, y])
+                expected = simulate(fork, enemy_deploys=enemy_deploys)
+                self.assertEqual([expected.my_health, expected.enemy_health], [results.my_health[index], results.enemy_health[index]])
+                self.assertEqual([sum(1 for breach in expected.breaches if breach[2] == player_index) for player_index in (0, 1)],
+                                 results.breaches[index].tolist())
+                self.assertEqual([sum(1 for destroyed in expected.destroyed if destroyed[3] == player_index) for player_index in (0, 1)],
+                                 results.destroyed[index].tolist())
+                self.assertEqual(list(expected.structure_damage), results.structure_damage[index].tolist())
+                self.assertEqual(expected.frames, results.frames[index])
+                self.assertEqual(np.subtract(game.get_resources(0), fork.get_resources(0)).tolist(), results.cost[index].tolist())
+            self.assertEqual([0, 5], results.cost[1].tolist())
+            self.assertEqual([5, 3], results.cost[-3].tolist())
+            self.assertEqual([0, 3], results.cost[-1].tolist(), "Spawns past the MP available or off the edges should not count")
+            self.assertEqual(1, game.game_map.mobile_unit_count([13, 0]), "Simulating should not change the game state")
+        self.assertEqual(0, len(simulate_batch(game, []).frames))
+
+    def test_simulator_targets(self):
+        for seed in range(3):
+            game = self.make_turn_0_map()
+            rng = random.Random(seed)
+            for location in game.game_map:
+                roll = rng.random()
+                player_index = 0 if location[1] < game.HALF_ARENA else 1
+                if roll < 0.15:
+                    game.game_map.add_unit(rng.choice(["FF", "EF", "DF"]), location, player_index)
+                elif roll < 0.3:
+                    for _ in range(rng.randint(1, 3)):
+                        game.game_map.add_unit(rng.choice(["PI", "EI", "SI"]), location, rng.randint(0, 1))
+                        game.game_map[location][-1].health = rng.choice([5, 10, 15])
+            simulation = _Simulation(game, None, None, None)
+            for location, structure in simulation.structures.items():
+                self.assertIs(game.get_target(game.game_map.structure_at(location)) is None, simulation._target(structure, location) is None)
+            for mover in simulation.movers:
+                expected = game.get_target(game.game_map[mover.location][simulation.cells[mover.location].index(mover)])
+                target = simulation._target(mover.unit, mover.location)
+                self.assertEqual(expected is None, target is None)
+                if expected is not None:
+                    self.assertEqual((expected.unit_type, expected.x, expected.y, expected.health, expected.player_index),
+                                     (target.unit_type, target.x, target.y, target.health, target.player_index))
+
     def test_trivial_functions(self):
         game = self.make_turn_0_map()
 
@@ -239,6 +672,21 @@ class BasicTests(unittest.TestCase):
         game = self.make_turn_0_map()
         self.assertEqual(1, len(game.game_map.get_locations_in_range([13,13], 0)), "We should be in 0 range of ourself")
         self.assertEqual(37, len(game.game_map.get_locations_in_range([13,13], 3.5)), "Wrong number of tiles in range")
+        self.assertEqual(game.game_map.get_locations_in_range([0,13], 4.5), [list(location) for location in game.game_map.locations_in_range([0,13], 4.5)], "Cached range should match")
+        self.assertIs(game.game_map.locations_in_range([0,13], 4.5), game.game_map.locations_in_range([0,13], 4.5), "Range results should be cached")
+
+        # Every cell at every configured range, base and upgraded, against the original square scan
+        hit_radius = game.config["unitInformation"][0]["getHitRadius"]
+        radii = {0, 1.5, 3.5, 4.5}
+        for unit_info in game.config["unitInformation"]:
+            for info in (unit_info, unit_info.get("upgrade", {})):
+                radii.update(info[key] for key in ("attackRange", "shieldRange", "selfDestructRange") if key in info)
+        for radius in sorted(radii):
+            for x, y in game.game_map:
+                span = math.ceil(radius)
+                expected = [[i, j] for i in range(x - span, x + span + 1) for j in range(y - span, y + span + 1)
+                            if game.game_map.in_arena_bounds([i, j]) and math.sqrt((x - i) ** 2 + (y - j) ** 2) < radius + hit_radius]
+                self.assertEqual(expected, game.game_map.get_locations_in_range([x, y], radius), "Range {} at {} should match the square scan".format(radius, [x, y]))
 
     def _test_get_attackers(self):
         game = self.make_turn_0_map()
@@ -275,3 +723,300 @@ class BasicTests(unittest.TestCase):
         actual = game.project_future_MP(turns)
         self.assertAlmostEqual(actual, expected, 0, "Expected {} MP {} turns from now, got {}".format(expected, turns, actual))
 
+    def test_path_finder_matches_reference(self):
+        for seed in range(12):
+            game = self.make_random_map(seed, density=0.1 + seed * 0.03)
+            fast = ShortestPathFinder()
+            reference = NodePathFinder()
+            rng = random.Random(seed)
+            # The reference path-finder iterates the map too, inside this loop
+            for location in game.game_map:
+                if rng.random() > 0.06 or game.contains_stationary_unit(location):
+                    continue
+                end_points = game.game_map.get_edge_locations(game.get_target_edge(location))
+                expected = reference.navigate_multiple_endpoints(location, end_points, game)
+                got = fast.navigate_multiple_endpoints(location, end_points, game)
+                self.assertEqual(expected, got, "Paths differ from {} on board {}".format(location, seed))
+
+    def test_path_cache(self):
+        game = self.make_turn_0_map()
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual(path, game.find_path_to_edge([13, 0]), "Cached path differs from the computed one")
+        self.assertEqual((1, 1), (game.path_cache_hits, game.path_cache_misses), "Second query should hit the cache")
+
+        version = game.board_version
+        game.attempt_spawn("FF", [13, 1])
+        self.assertNotEqual(version, game.board_version, "Spawning a structure should change the board version")
+        self.assertNotEqual(path, game.find_path_to_edge([13, 0]), "Path should change after blocking it")
+        self.assertEqual(2, game.path_cache_misses, "Stale path was served from the cache")
+
+        version = game.board_version
+        game.game_map.add_unit("PI", [13, 0])
+        self.assertEqual(version, game.board_version, "Mobile units do not change pathing")
+        game.game_map.remove_unit([13, 1])
+        self.assertNotEqual(version, game.board_version, "Removing a structure should change the board version")
+
+    def test_paths_from_all(self):
+        for seed in range(6):
+            game = self.make_random_map(seed, density=0.1 + seed * 0.06)
+            locations = list(game.game_map)
+            finder = ShortestPathFinder()
+            paths = finder.paths_from_all(locations, None, game)
+            for location, path in zip(locations, paths):
+                if game.contains_stationary_unit(location):
+                    self.assertIsNone(path, "Blocked locations have no path")
+                    continue
+                end_points = game.game_map.get_edge_locations(game.get_target_edge(location))
+                self.assertEqual(finder.navigate_multiple_endpoints(location, end_points, game), path, "Batched path differs from {} on board {}".format(location, seed))
+
+        game = self.make_random_map(0)
+        game.suppress_warnings(True)
+        edge = game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT) + game.game_map.get_edge_locations(game.game_map.BOTTOM_RIGHT)
+        paths = game.find_paths_to_edge(edge)
+        self.assertEqual(0, game.path_cache_hits, "Nothing should be cached yet")
+        self.assertEqual([game.find_path_to_edge(location) for location in edge], paths, "find_paths_to_edge should match find_path_to_edge")
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_numpy_path_finder(self):
+        # One finder for every board, so its stored edge fields have to follow each change of board
+        finder = NumpyPathFinder()
+        for seed in range(8):
+            game = self.make_random_map(seed, density=0.05 + seed * 0.05)
+            locations = list(game.game_map)
+            reference = ShortestPathFinder()
+            self.assertEqual(reference.paths_from_all(locations, None, game), finder.paths_from_all(locations, None, game), "Batched paths differ on board {}".format(seed))
+            walls = random.Random(seed).sample(locations, 40)
+            self.assertEqual(reference.paths_from_all(locations, None, game, walls), finder.paths_from_all(locations, None, game, walls),
+                             "Batched paths differ with hypothetical walls on board {}".format(seed))
+            for location in random.Random(seed).sample(locations, 25):
+                end_points = game.game_map.get_edge_locations(game.get_target_edge(location))
+                expected = reference.navigate_multiple_endpoints(location, end_points, game)
+                self.assertEqual(expected, finder.navigate_multiple_endpoints(location, end_points, game), "Paths differ from {} on board {}".format(location, seed))
+
+        reference = self.make_turn_0_map()
+        game = GameState(reference.config, reference.serialized_string, path_finder="numpy")
+        self.assertIsInstance(game._shortest_path_finder, NumpyPathFinder, "The numpy backend should be selectable by name")
+        self.assertEqual(reference.find_path_to_edge([13, 0]), game.find_path_to_edge([13, 0]), "Backends should agree")
+
+    def test_timed_paths(self):
+        game = self.make_random_map(3, density=0.15)
+        game.suppress_warnings(True)
+        self.assertEqual((1, 2, 4), tuple(game.frames_per_move(unit_type) for unit_type in ["PI", "EI", "SI"]), "Frames per move should be 1 / speed")
+        self.assertIsNone(game.frames_per_move("FF"), "Structures do not move")
+
+        starts = game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT)
+        misses = game.path_cache_misses
+        timed = game.find_timed_paths_to_edge(starts, ["PI", "EI", "SI"])
+        self.assertEqual(misses + len(starts) - sum(bool(game.contains_stationary_unit(start)) for start in starts), game.path_cache_misses, "Each start should be pathed once for all unit types")
+        for start, by_type in zip(starts, timed):
+            path = game.find_path_to_edge(start)
+            for unit_type, frames in [("PI", 1), ("EI", 2), ("SI", 4)]:
+                if path is None:
+                    self.assertIsNone(by_type[unit_type], "Blocked starts have no timed path")
+                    continue
+                self.assertEqual([location for location, _, _ in by_type[unit_type]], path, "Timed path should follow the path")
+                self.assertEqual((0, frames), by_type[unit_type][0][1:], "Units wait frames_per_move on their spawn location")
+                self.assertEqual(len(path) * frames, by_type[unit_type][-1][2], "Wrong arrival time")
+                self.assertEqual(by_type[unit_type], game.find_timed_path_to_edge(start, unit_type), "Batched and single timed paths should match")
+
+    def test_map_iteration(self):
+        game_map = self.make_turn_0_map().game_map
+        locations = list(game_map)
+        self.assertEqual(420, len(locations), "The diamond has 420 locations")
+        self.assertEqual([[13, 0], [14, 0]], locations[:2], "Iteration starts at the bottom row")
+        self.assertEqual(len(locations) ** 2, sum(1 for _ in game_map for _ in game_map), "Nested iteration over the map should be independent")
+        self.assertEqual([tuple(location) for location in locations], list(game_map.iter_cells()), "iter_cells should visit the same locations")
+        self.assertEqual(210, len(list(game_map.iter_cells(half=0))), "Each half has 210 locations")
+        self.assertTrue(all(y >= game_map.HALF_ARENA for _, y in game_map.iter_cells(half=1)), "Top half should only have top locations")
+        self.assertEqual([(x, 13) for x in range(28)], list(game_map.iter_cells(row=13)), "Row 13 spans the whole arena")
+        self.assertEqual([], list(game_map.iter_cells(half=1, row=13)), "Row 13 is on the bottom half")
+        for x in range(-1, 29):
+            for y in range(-1, 29):
+                row_size = y + 1 if y < 14 else 28 - y
+                expected = 0 <= y < 28 and 14 - row_size <= x < 14 + row_size
+                self.assertEqual(expected, game_map.in_arena_bounds([x, y]), "Wrong bounds for {}".format([x, y]))
+
+    def test_occupancy_index(self):
+        game = self.make_random_map(6, density=0.2)
+        game_map = game.game_map
+        rng = random.Random(6)
+        locations = list(game_map)
+        game_map[10, 5] = [GameUnit("DF", game.config, 0, None, 10, 5)]
+        game_map.remove_unit(rng.choice(locations))
+        game.attempt_spawn("EF", [13, 2])
+        for location in rng.sample(locations, 20):
+            game_map.add_unit(rng.choice(["EF", "DF", "PI"]), location, rng.choice([0, 1]))
+
+        for location in locations:
+            structures = [unit for unit in game_map[location] if unit.stationary]
+            self.assertEqual(structures[0] if structures else None, game_map.structure_at(location), "Index is stale at {}".format(location))
+        for player_index in [0, 1]:
+            for unit_type in ["FF", "EF", "DF"]:
+                expected = sorted((x, y) for x, y in locations if game_map.structure_at([x, y]) and game_map.structure_at([x, y]).player_index == player_index and game_map.structure_at([x, y]).unit_type == unit_type)
+                self.assertEqual(expected, sorted(game_map.structure_locations(player_index, unit_type)), "Wrong {} locations for player {}".format(unit_type, player_index))
+        self.assertEqual(len(game_map.structure_locations()), len(game_map.structure_locations(0)) + len(game_map.structure_locations(1)), "Per player locations should add up")
+        self.assertEqual("EF", game.contains_stationary_unit([13, 2]).unit_type, "Spawned structures should be indexed")
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_board_arrays(self):
+        game = self.make_random_map(8, density=0.2)
+        game.suppress_warnings(True)
+        arrays = game.as_arrays()
+        self.assertEqual(len(game.game_map.structure_locations()), int((arrays.structure_type >= 0).sum()), "Every structure should be in the arrays")
+
+        rng = random.Random(8)
+        locations = list(game.game_map)
+        game.attempt_spawn("DF", [13, 3])
+        game.attempt_spawn("PI", [13, 0], 3)
+        game.attempt_upgrade([13, 3])
+        game.game_map.remove_unit(rng.choice(locations))
+        game.game_map[5, 10] = [GameUnit("EF", game.config, 0, 7, 5, 10)]
+        for location in rng.sample(locations, 15):
+            game.game_map.add_unit(rng.choice(["FF", "SI", "EI"]), location, rng.choice([0, 1]))
+        self.assertIs(arrays, game.as_arrays(), "Arrays should be updated in place")
+
+        expected = empty_board_arrays(game.ARENA_SIZE, 3)
+        for x, y in locations:
+            write_location(expected, game.game_map[x, y], x, y, *unit_type_indices(game.config))
+        for name in expected._fields:
+            self.assertTrue(np.array_equal(getattr(expected, name), getattr(arrays, name)), "{} is out of sync".format(name))
+        self.assertEqual(3, arrays.mobile_counts[0, 0, 13, 0], "Spawned scouts should be counted")
+        self.assertTrue(arrays.upgraded[13, 3], "Upgrades should be reflected")
+        self.assertEqual(7, arrays.health[5, 10], "Health should come from the unit")
+
+    def test_unit_specs(self):
+        game = self.make_turn_0_map()
+        turret = GameUnit("DF", game.config, 0, None, 13, 5)
+        other = GameUnit("DF", game.config, 1, 10, 14, 20)
+        self.assertIs(turret.spec, other.spec, "Units of a type should share their spec")
+        self.assertEqual((5, 2.5, 90, 10), (turret.damage_i, turret.attackRange, turret.max_health, other.health), "Stats should come from the config")
+        self.assertEqual([2, 0], turret.cost, "Wrong cost")
+        self.assertFalse(hasattr(turret, "__dict__"), "Units should not carry a per-instance dict")
+
+        turret.upgrade()
+        self.assertTrue(turret.upgraded, "Unit should be upgraded")
+        self.assertEqual((15, 3.5, 90), (turret.damage_i, turret.attackRange, turret.max_health), "Upgraded stats should come from the upgrade config")
+        self.assertEqual([6, 0], turret.cost, "Upgraded cost should include the upgrade")
+        self.assertEqual(5, other.damage_i, "Upgrading a unit must not change other units of its type")
+
+        other_game = self.make_turn_0_map()
+        self.assertIsNot(turret.spec, GameUnit("DF", other_game.config).spec, "Each config should get its own specs")
+        self.assertIs(other_game.config, unit._last_specs[0], "Only the last config should be kept")
+
+    def test_bitboard(self):
+        game = self.make_random_map(2, density=0.35)
+        game_map = game.game_map
+        for edge, locations in enumerate(game_map.get_edges()):
+            self.assertEqual(bitboard.from_locations(locations), bitboard.EDGES[edge], "Edge {} mask is wrong".format(edge))
+        self.assertEqual(list(game_map), bitboard.to_locations(bitboard.ARENA), "Arena mask should hold every map location")
+        self.assertEqual(bitboard.ARENA, bitboard.BOTTOM_HALF | bitboard.TOP_HALF, "Halves should cover the arena")
+
+        blocked = bitboard.blocked_board(game_map)
+        finder = ShortestPathFinder()
+        finder.initialize_map(game)
+        self.assertEqual(blocked, bitboard.from_cells(finder.blocked), "Blocked boards should agree")
+        for location in random.Random(2).sample(list(game_map), 30):
+            expected = []
+            if not game.contains_stationary_unit(location):
+                expected = [list(location)]
+                for current in expected:
+                    for neighbor in [[current[0], current[1] + 1], [current[0], current[1] - 1], [current[0] + 1, current[1]], [current[0] - 1, current[1]]]:
+                        if game_map.in_arena_bounds(neighbor) and not game.contains_stationary_unit(neighbor) and neighbor not in expected:
+                            expected.append(neighbor)
+            pocket = bitboard.pocket(location, blocked)
+            self.assertEqual(sorted(expected, key=lambda cell: (cell[1], cell[0])), bitboard.to_locations(pocket), "Wrong pocket for {}".format(location))
+            edge = game.get_target_edge(location)
+            self.assertEqual(any(cell in expected for cell in game_map.get_edge_locations(edge)), bitboard.can_reach_edge(location, edge, blocked), "Wrong reachability for {}".format(location))
+
+    def test_incremental_path_finder(self):
+        rng = random.Random(4)
+        game = self.make_random_map(4, density=0.2)
+        finder = IncrementalPathFinder(rebuild_threshold=10)
+        scratch = ShortestPathFinder()
+        locations = list(game.game_map)
+        for turn in range(40):
+            changes = rng.choice([1, 2, 3, 5, 30])
+            for location in rng.sample(locations, changes):
+                if game.contains_stationary_unit(location):
+                    game.game_map.remove_unit(location)
+                else:
+                    game.game_map.add_unit("FF", location)
+
+            finder.update(game)
+            scratch.initialize_map(game)
+            for edge, end_points in enumerate(game.game_map.get_edges()):
+                end_cells = [cell_id(location) for location in end_points]
+                scratch._validate(end_cells[0], end_cells)
+                self.assertEqual(list(scratch.pathlength), list(finder.fields[edge]), "Repaired field for edge {} differs on turn {}".format(edge, turn))
+            starts = rng.sample(locations, 10)
+            self.assertEqual(scratch.paths_from_all(starts, None, game), finder.paths_from_all(starts, None, game), "Paths differ on turn {}".format(turn))
+        self.assertGreater(finder.repairs, 0, "Small changes should be repaired")
+        self.assertGreater(finder.rebuilds, 1, "Large changes should rebuild")
+
+    def test_repath(self):
+        game = self.make_random_map(9, density=0.3)
+        game.suppress_warnings(True)
+        rng = random.Random(9)
+        finder = IncrementalPathFinder()
+        scratch = ShortestPathFinder()
+        structures = [location for location in game.game_map if game.contains_stationary_unit(location)]
+        for _ in range(5):
+            destroyed = []
+            start = rng.choice([location for location in game.game_map if not game.contains_stationary_unit(location)])
+            edge = game.get_target_edge(start)
+            end_points = game.game_map.get_edge_locations(edge)
+            end_cells = [cell_id(location) for location in end_points]
+            direction = scratch._get_direction_from_endpoints(end_points)
+            path = game.find_path_to_edge(start)
+            for frame in range(1, 8):
+                destroyed += rng.sample(structures, 4)
+                location = path[min(frame, len(path) - 1)]
+                previous = path[min(frame, len(path) - 1) - 1]
+                move_direction = 0 if location == previous else scratch.VERTICAL if location[0] == previous[0] else scratch.HORIZONTAL
+
+                scratch.initialize_map(game, None, destroyed)
+                scratch._validate(scratch._idealness_search(cell_id(location), end_cells, direction), end_cells)
+                expected = scratch._get_path(location, direction, scratch.pathlength, move_direction)
+                path = finder.repath(location, edge, game, move_direction, destroyed)
+                self.assertEqual(expected, path, "Continuation path from {} is wrong on frame {}".format(location, frame))
+        self.assertEqual(1, finder.rebuilds, "Re-pathing should only repair the stored fields")
+
+    def test_path_overlays(self):
+        game = self.make_random_map(7, density=0.15)
+        game.suppress_warnings(True)
+        rng = random.Random(7)
+        locations = list(game.game_map)
+        starts = game.game_map.get_edge_locations(game.game_map.TOP_LEFT) + game.game_map.get_edge_locations(game.game_map.TOP_RIGHT)
+        for finder in [ShortestPathFinder(), IncrementalPathFinder()]:
+            game._shortest_path_finder = finder
+            for _ in range(10):
+                extra_blocked = rng.sample(locations, 6)
+                extra_open = [location for location in rng.sample(locations, 40) if game.contains_stationary_unit(location)]
+                overlay_paths = game.find_paths_to_edge(starts, extra_blocked=extra_blocked, extra_open=extra_open)
+
+                version = game.board_version
+                expected = self.make_random_map(7, density=0.15)
+                for location in extra_open:
+                    expected.game_map.remove_unit(location)
+                for location in extra_blocked:
+                    expected.game_map.add_unit("FF", location)
+                expected.suppress_warnings(True)
+                self.assertEqual(expected.find_paths_to_edge(starts), overlay_paths, "Overlay paths should match paths on the edited map")
+                self.assertEqual(overlay_paths[3], game.find_path_to_edge(starts[3], extra_blocked=extra_blocked, extra_open=extra_open), "Single overlay query should match the batch")
+                self.assertEqual(version, game.board_version, "Overlays must not change the game map")
+            self.assertEqual(ShortestPathFinder().paths_from_all(starts, None, game), finder.paths_from_all(starts, None, game), "Overlays should leave the path-finder's own board untouched")
+
+    def test_path_sensitivity(self):
+        for seed in [1, 5]:
+            game = self.make_random_map(seed, density=0.25)
+            game.suppress_warnings(True)
+            game.game_map.add_unit("DF", [13, 12], 0)
+            table = path_sensitivity(game)
+            self.assertEqual(table.base_paths, game.find_paths_to_edge(table.starts), "Base paths are wrong")
+            for location in random.Random(seed).sample(sorted(table.cells), 40):
+                row = table[location]
+                paths = game.find_paths_to_edge(table.starts, extra_blocked=[location])
+                changed = tuple(index for index, path in enumerate(paths) if path != table.base_paths[index])
+                self.assertEqual(changed, row.changed_starts, "Wrong changed starts when blocking {}".format(location))
+                self.assertEqual(tuple(len(path) for path in paths), row.path_lengths, "Wrong path lengths when blocking {}".format(location))
+            self.assertTrue(all(row.changed_starts for row in table.critical_cells()), "Critical cells must change a path")
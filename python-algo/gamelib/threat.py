@@ -0,0 +1,268 @@
+from array import array
+
+from .navigation import ARENA_SIZE
+
+"""
+Threat and shield fields hold, for every location, what a mobile unit standing there gets from the
+structures around it: the damage per frame of the enemy structures that can attack it, or the shield of
+the friendly supports in range. They are indexed x * ARENA_SIZE + y, like path_analysis.
+
+A field is built once from the board and then kept up to date by comparing the structures with the ones
+it was built from, so adding, removing or upgrading a single structure only touches the locations in
+that structure's range.
+"""
+
+
+def support_shield(unit):
+    """Gets the shield a support gives each mobile unit it shields
+
+    Args:
+        unit: A GameUnit with a shield, usually a SUPPORT
+
+    Returns:
+        shieldPerUnit, plus shieldBonusPerY for every row the unit is forward of its owner's edge
+
+    """
+    amount = unit.shieldPerUnit
+    if unit.shieldBonusPerY:
+        rows_forward = unit.y if unit.player_index == 0 else ARENA_SIZE - 1 - unit.y
+        amount += unit.shieldBonusPerY * rows_forward
+    return amount
+
+
+class _StructureField:
+    """Shared bookkeeping of ThreatField and ShieldField. Subclasses choose the structures with _source
+    and add or remove one with _apply
+    """
+    def __init__(self, player_index):
+        self.player_index = player_index
+        self.board_version = None
+        # The structures the field was built from, location: whatever _source returned for it
+        self._sources = {}
+        self._game_map = None
+
+    def copy(self):
+        """Gets an independent copy of this field
+        """
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        other._sources = dict(self._sources)
+        return other
+
+    def update(self, game_map):
+        """Brings the field up to date with a map, adding and removing only the structures that changed
+
+        Args:
+            game_map: The GameMap to read the structures from
+
+        """
+        sources = {}
+        for location in game_map.structure_locations(self._owner()):
+            source = self._source(game_map.structure_at(location), location)
+            if source is not None:
+                sources[location] = source
+        old_sources = self._sources
+        for location, source in old_sources.items():
+            if sources.get(location) != source:
+                self._apply(game_map, location, source, -1)
+        for location, source in sources.items():
+            if old_sources.get(location) != source:
+                self._apply(game_map, location, source, 1)
+        self._sources = sources
+        self._game_map = game_map
+        self.board_version = game_map.board_version
+
+    def _sources_reaching(self, location):
+        """The locations of the structures whose range, the last item of their source, covers a location
+        """
+        x, y = location
+        return [source_location for source_location, source in self._sources.items()
+                if (source_location[0] - x) ** 2 + (source_location[1] - y) ** 2 <= source[-1] * source[-1]]
+
+    @staticmethod
+    def _cells_in_range(game_map, structure_location, radius):
+        sx, sy = structure_location
+        limit = radius * radius
+        for x, y in game_map.locations_in_range(structure_location, radius):
+            if (x - sx) ** 2 + (y - sy) ** 2 <= limit:
+                yield x * ARENA_SIZE + y
+
+
+class ThreatField(_StructureField):
+    """The threat one player's mobile units face from the other player's structures, see GameState.threat_field
+
+    Attributes :
+        * player_index (int): The defending player, whose mobile units are attacked
+        * attacker_counts (array): The number of structures that can attack each location
+        * damage (array): The damage per frame those structures deal to a mobile unit on each location
+        * board_version (int): The GameMap.board_version the field was last brought up to date with
+
+    """
+    def __init__(self, player_index):
+        super().__init__(player_index)
+        self.attacker_counts = array('H', bytes(2 * ARENA_SIZE * ARENA_SIZE))
+        self.damage = array('d', bytes(8 * ARENA_SIZE * ARENA_SIZE))
+
+    def copy(self):
+        other = super().copy()
+        other.attacker_counts = array('H', self.attacker_counts)
+        other.damage = array('d', self.damage)
+        return other
+
+    def _owner(self):
+        return 1 - self.player_index
+
+    def _source(self, unit, location):
+        if unit.damage_i + unit.damage_f > 0:
+            return unit.damage_i, unit.attackRange
+        return None
+
+    def _apply(self, game_map, structure_location, source, sign):
+        damage_i, attack_range = source
+        counts = self.attacker_counts
+        damage = self.damage
+        for index in self._cells_in_range(game_map, structure_location, attack_range):
+            counts[index] += sign
+            damage[index] += sign * damage_i
+
+    def damage_at(self, location):
+        """Gets the damage per frame a mobile unit on a location takes, 0 outside the arena
+        """
+        x, y = location
+        if 0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE:
+            return self.damage[int(x) * ARENA_SIZE + int(y)]
+        return 0
+
+    def count_at(self, location):
+        """Gets the number of structures that can attack a mobile unit on a location, 0 outside the arena
+        """
+        x, y = location
+        if 0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE:
+            return self.attacker_counts[int(x) * ARENA_SIZE + int(y)]
+        return 0
+
+    def attackers(self, location):
+        """Gets the structures that can attack a mobile unit on a location
+
+        Returns:
+            A list of GameUnits, the structures get_attackers would return for the location
+
+        """
+        if not self.count_at(location):
+            return []
+        return [self._game_map.structure_at(source) for source in self._sources_reaching(location)]
+
+    def exposure(self, path):
+        """Gets the total damage per frame a mobile unit takes along a path, one frame on each location
+
+        Args:
+            path: A list of locations, such as the result of find_path_to_edge
+
+        Returns:
+            The sum of the damage on every location of the path, None if the path is None
+
+        """
+        if path is None:
+            return None
+        damage = self.damage
+        return sum(damage[x * ARENA_SIZE + y] for x, y in path)
+
+
+class ShieldField(_StructureField):
+    """The shield one player's supports give that player's mobile units, see GameState.shield_field
+
+    A support shields each mobile unit once, the first time the unit comes within its shieldRange, by
+    shieldPerUnit plus shieldBonusPerY for every row the support is placed forward of its owner's edge.
+    shield holds the total of every support in range of a location. Use path_shield for a whole path,
+    which counts each support once however many locations of the path it covers.
+
+    Attributes :
+        * player_index (int): The player whose supports and mobile units are counted
+        * shield (array): The total shield of the supports in range of each location
+        * supporter_masks (list): For each location, an int with one bit set for each support in range
+        * board_version (int): The GameMap.board_version the field was last brought up to date with
+
+    """
+    def __init__(self, player_index):
+        super().__init__(player_index)
+        self.shield = array('d', bytes(8 * ARENA_SIZE * ARENA_SIZE))
+        self.supporter_masks = [0] * (ARENA_SIZE * ARENA_SIZE)
+        # The supporter_masks bit of each support, the shield of each bit and the bits no support uses
+        self._bits = {}
+        self._bit_shields = {}
+        self._free_bits = []
+
+    def copy(self):
+        other = super().copy()
+        other.shield = array('d', self.shield)
+        other.supporter_masks = list(self.supporter_masks)
+        other._bits = dict(self._bits)
+        other._bit_shields = dict(self._bit_shields)
+        other._free_bits = list(self._free_bits)
+        return other
+
+    def _owner(self):
+        return self.player_index
+
+    def _source(self, unit, location):
+        amount = support_shield(unit)
+        if amount > 0 and unit.shieldRange > 0:
+            return amount, unit.shieldRange
+        return None
+
+    def _apply(self, game_map, structure_location, source, sign):
+        amount, shield_range = source
+        if sign > 0:
+            bit = self._free_bits.pop() if self._free_bits else 1 << len(self._bits)
+            self._bits[structure_location] = bit
+            self._bit_shields[bit] = amount
+        else:
+            bit = self._bits.pop(structure_location)
+            del self._bit_shields[bit]
+            self._free_bits.append(bit)
+        shield = self.shield
+        masks = self.supporter_masks
+        for index in self._cells_in_range(game_map, structure_location, shield_range):
+            shield[index] += sign * amount
+            masks[index] ^= bit
+
+    def shield_at(self, location):
+        """Gets the total shield of the supports in range of a location, 0 outside the arena
+        """
+        x, y = location
+        if 0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE:
+            return self.shield[int(x) * ARENA_SIZE + int(y)]
+        return 0
+
+    def supporters(self, location):
+        """Gets the supports in range of a location
+
+        Returns:
+            A list of GameUnits
+
+        """
+        return [self._game_map.structure_at(source) for source in self._sources_reaching(location)]
+
+    def path_shield(self, path):
+        """Gets the shield a mobile unit gains walking a path, counting each support once
+
+        Args:
+            path: A list of locations, such as the result of find_path_to_edge
+
+        Returns:
+            The total shield of every support in range of any location of the path, None if the path is None
+
+        """
+        if path is None:
+            return None
+        masks = self.supporter_masks
+        mask = 0
+        for x, y in path:
+            mask |= masks[x * ARENA_SIZE + y]
+        total = 0
+        bit_shields = self._bit_shields
+        while mask:
+            bit = mask & -mask
+            total += bit_shields[bit]
+            mask ^= bit
+        return total
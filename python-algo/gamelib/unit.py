@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 def is_stationary(unit_type, structure_types):
     """
         Args:
@@ -9,9 +11,65 @@ def is_stationary(unit_type, structure_types):
     return unit_type in structure_types
 
 
+"""
+The fixed stats of one unit type, before or after upgrading. Every GameUnit of a type shares the same spec,
+see unit_specs. Fields match the GameUnit attributes of the same name.
+"""
+UnitSpec = namedtuple("UnitSpec", ["unit_type", "stationary", "speed", "damage_f", "damage_i", "attackRange", "shieldRange",
+                                   "max_health", "shieldPerUnit", "shieldBonusPerY", "cost"])
+
+# The last config unit_specs compiled and its specs. Only one is kept so configs that are done with can be freed
+_last_specs = [None, None]
+
+
+def _compile_spec(unit_type, type_config, base=None):
+    """Builds the spec of a unit type from its config, or of its upgrade when base is the base spec
+    """
+    if base is None:
+        return UnitSpec(unit_type, type_config.get("unitCategory") == 0, type_config.get("speed", 0),
+                        type_config.get("attackDamageTower", 0), type_config.get("attackDamageWalker", 0),
+                        type_config.get("attackRange", 0), type_config.get("shieldRange", 0),
+                        type_config.get("startHealth", 0), type_config.get("shieldPerUnit", 0),
+                        type_config.get("shieldBonusPerY", 0), (type_config.get("cost1", 0), type_config.get("cost2", 0)))
+    return UnitSpec(unit_type, base.stationary, type_config.get("speed", base.speed),
+                    type_config.get("attackDamageTower", base.damage_f), type_config.get("attackDamageWalker", base.damage_i),
+                    type_config.get("attackRange", base.attackRange), type_config.get("shieldRange", base.shieldRange),
+                    type_config.get("startHealth", base.max_health), type_config.get("shieldPerUnit", base.shieldPerUnit),
+                    type_config.get("shieldBonusPerY", base.shieldBonusPerY),
+                    (type_config.get("cost1", 0) + base.cost[0], type_config.get("cost2", 0) + base.cost[1]))
+
+
+def unit_specs(config):
+    """Gets the specs of every unit type in a config, compiling them unless it is the config last compiled
+
+    Args:
+        config: The game config
+
+    Returns:
+        A dict mapping each unit type's shorthand to a tuple (base spec, upgraded spec)
+
+    """
+    if config is _last_specs[0]:
+        return _last_specs[1]
+    specs = {}
+    for type_config in config["unitInformation"]:
+        base = _compile_spec(type_config.get("shorthand"), type_config)
+        specs[base.unit_type] = (base, _compile_spec(base.unit_type, type_config.get("upgrade", {}), base))
+    _last_specs[0] = config
+    _last_specs[1] = specs
+    return specs
+
+
+def _spec_property(name):
+    return property(lambda unit: getattr(unit._spec, name))
+
+
 class GameUnit:
     """Holds information about a Unit. 
 
+    Units only store their position, owner, health and flags. Everything else is read from the UnitSpec
+    shared by all units of the same type, so the stats below can not be assigned to.
+
     Attributes :
         * unit_type (string): This unit's type
         * config (JSON): Contains information about the game
@@ -30,8 +88,11 @@ class GameUnit:
         * shieldPerUnit (float): how much shield is given per unit
         * pending_removal (boolean): If this unit is marked for removal by its owner
         * upgraded (boolean): If this unit is upgraded
+        * spec (UnitSpec): The shared stats of this unit's type, upgraded or not
 
     """
+    __slots__ = ("unit_type", "config", "player_index", "pending_removal", "upgraded", "x", "y", "health", "stationary", "_spec", "_specs")
+
     def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1):
         """ Initialize unit variables using args passed
 
@@ -43,38 +104,39 @@ class GameUnit:
         self.upgraded = False
         self.x = x
         self.y = y
-        self.__serialize_type()
-        self.health = self.max_health if not health else health
-
-    def __serialize_type(self):
-        from .game_state import STRUCTURE_TYPES, UNIT_TYPE_TO_INDEX, SUPPORT
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        self.stationary = type_config["unitCategory"] == 0
-        self.speed = type_config.get("speed", 0)
-        self.damage_f = type_config.get("attackDamageTower", 0)
-        self.damage_i = type_config.get("attackDamageWalker", 0)
-        self.attackRange = type_config.get("attackRange", 0)
-        self.shieldRange = type_config.get("shieldRange", 0)
-        self.max_health = type_config.get("startHealth", 0)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
-        self.shieldBonusPerY = type_config.get("shieldBonusPerY", 0)
-        self.cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
+        self._specs = unit_specs(config)[unit_type]
+        self._spec = self._specs[0]
+        self.stationary = self._spec.stationary
+        self.health = self._spec.max_health if not health else health
+
+    speed = _spec_property("speed")
+    damage_f = _spec_property("damage_f")
+    damage_i = _spec_property("damage_i")
+    attackRange = _spec_property("attackRange")
+    shieldRange = _spec_property("shieldRange")
+    max_health = _spec_property("max_health")
+    shieldPerUnit = _spec_property("shieldPerUnit")
+    shieldBonusPerY = _spec_property("shieldBonusPerY")
 
+    @property
+    def cost(self):
+        return list(self._spec.cost)
+
+    @property
+    def spec(self):
+        return self._spec
 
     def upgrade(self):
-        from .game_state import UNIT_TYPE_TO_INDEX
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]].get("upgrade", {})
-        self.speed = type_config.get("speed", self.speed)
-        self.damage_f = type_config.get("attackDamageTower", self.damage_f)
-        self.damage_i = type_config.get("attackDamageWalker", self.damage_i)
-        self.attackRange = type_config.get("attackRange", self.attackRange)
-        self.shieldRange = type_config.get("shieldRange", self.shieldRange)
-        self.max_health = type_config.get("startHealth", self.max_health)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", self.shieldPerUnit)
-        self.shieldBonusPerY = type_config.get("shieldBonusPerY", self.shieldBonusPerY)
-        self.cost = [type_config.get("cost1", 0) + self.cost[0], type_config.get("cost2", 0) + self.cost[1]]
+        self._spec = self._specs[1]
         self.upgraded = True
 
+    def copy(self):
+        """Gets an independent copy of this unit, sharing its spec and config
+        """
+        unit = GameUnit.__new__(GameUnit)
+        for name in GameUnit.__slots__:
+            setattr(unit, name, getattr(self, name))
+        return unit
 
     def __toString(self):
         owner = "Friendly" if self.player_index == 0 else "Enemy"
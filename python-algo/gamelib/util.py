@@ -1,4 +1,10 @@
 import sys
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
@@ -21,6 +27,21 @@ def get_command():
         exit()
     return ret
 
+def decode_json(message):
+    """Decodes a json message from the game engine. 
+    Uses orjson when it is installed, which is several times faster than the json module, and json otherwise.
+
+    Args:
+        message: A json string
+
+    Returns:
+        The decoded json, usually a dict
+
+    """
+    if orjson is not None:
+        return orjson.loads(message)
+    return json.loads(message)
+
 def send_command(cmd):
     """Sends your turn to standard output.
     Should usually only be called by 'GameState.submit_turn()'